@@ -0,0 +1,335 @@
+"""
+ANNOTATION CACHE FILE READER
+(version 1.0)
+by Angelo Chan
+
+This module contains a Class capable of querying a binary annotation cache, as
+produced by GTF_to_BED.py, and a function for writing such caches.
+
+An annotation cache stores the same records as a 5-column BED file produced by
+GTF_to_BED.py, (chromosome, start, end, name, strand) in a compact binary form
+which can be memory-mapped and queried without being parsed:
+
+    Header
+    Chromosome table    - Name, index of the first record, number of records,
+                          and the length of the longest record, for each
+                          chromosome, in sorted order.
+    Records             - Fixed-width records, sorted by chromosome, start, and
+                          end.
+    Name index          - An open-addressing hash table of record indexes,
+                          keyed by record name.
+    String table        - The chromosome names and record names.
+
+All integers are unsigned 32-bit little-endian integers. Coordinates are stored
+as 1-based inclusive coordinates, the same as in the 5-column BED files produced
+by GTF_to_BED.py. Caches written from other formats, such as BED12, must have
+their coordinates converted first.
+"""
+
+# Imported Modules #############################################################
+
+import mmap
+import struct
+import zlib
+
+
+
+# Configurations ###############################################################
+
+CONFIG__magic = "GTFC"
+CONFIG__version = 2 # 2: All coordinates are 1-based and inclusive
+
+
+
+# Structs ######################################################################
+
+STRUCT__header = struct.Struct("<4sIIIIIIII")
+# Magic, version, records, chromosomes, hash slots, offsets of the chromosome
+# table, the records, the name index, and the string table
+
+STRUCT__chr = struct.Struct("<IIIII")
+# Name offset, name length, first record, number of records, longest record
+
+STRUCT__record = struct.Struct("<IIIIIcxxx")
+# Name offset, name length, chromosome index, start, end, strand
+
+STRUCT__slot = struct.Struct("<I")
+# Record index plus one. Zero indicates an empty slot.
+
+
+
+# Classes ######################################################################
+
+class Annotation_Cache_Reader:
+    """
+    The Annotation Cache Reader memory-maps an annotation cache and answers
+    queries directly from the mapped file. Only the chromosome table is loaded
+    into memory.
+    
+    Lookups by name use the hash index and take constant time. Overlap queries
+    use a binary search on the records of the chromosome.
+    
+    Records are returned in the same format as the rows of the BED file:
+        [chr, start, end, name, strand]
+    
+    Designed for the following use:
+    
+    c = Annotation_Cache_Reader("F:/Filepath.gtfc")
+    c.Open()
+    
+    records = c.Get("ABC1")
+    records = c.Get_Overlaps("chr1", 10000, 20000)
+    
+    c.Close()
+    """
+    
+    # Strings ##################################################################
+    
+    _MSG__invalid_file = "Not a valid annotation cache:\n\t{S}"
+    _MSG__invalid_version = ("Unsupported annotation cache version ({V}):\n"
+            "\t{S}")
+    
+    
+    
+    # Constructor & Destructor #################################################
+    
+    def __init__(self, file_path=""):
+        """
+        Creates an Annotation Cache Reader object.
+        """
+        self.file_path = file_path
+        self.file = None
+        self.map = None
+        self.chromosomes = {} # {chr: [index, first, count, longest]}
+        self.chr_names = []
+        self.records = 0
+        self.slots = 0
+        self.offset_records = 0
+        self.offset_index = 0
+        self.offset_strings = 0
+    
+    def __del__(self):
+        """
+        Close the cache, if it is still open.
+        """
+        self.Close()
+    
+    
+    
+    # File I/O Methods #########################################################
+    
+    def Open(self, new_path=""):
+        """
+        Memory-map the annotation cache and load its chromosome table. If a file
+        path is not specified, the stored file path will be used instead.
+        
+        Return True if the cache was opened successfully.
+        Return False otherwise.
+        """
+        if new_path: self.file_path = new_path
+        self.file = open(self.file_path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        if (len(self.map) < STRUCT__header.size or
+                self.map[:4] != CONFIG__magic):
+            self.printE(self._MSG__invalid_file.format(S = self.file_path))
+            self.Close()
+            return False
+        (magic, version, self.records, chromosomes, self.slots, offset_chr,
+                self.offset_records, self.offset_index,
+                self.offset_strings) = STRUCT__header.unpack_from(self.map, 0)
+        if version != CONFIG__version:
+            self.printE(self._MSG__invalid_version.format(V = version,
+                    S = self.file_path))
+            self.Close()
+            return False
+        # Chromosome table
+        self.chromosomes = {}
+        self.chr_names = []
+        for i in range(chromosomes):
+            name_offset, name_length, first, count, longest = (
+                    STRUCT__chr.unpack_from(self.map,
+                    offset_chr + i*STRUCT__chr.size))
+            name = self._get_string(name_offset, name_length)
+            self.chromosomes[name] = [i, first, count, longest]
+            self.chr_names.append(name)
+        return True
+    
+    def Close(self):
+        """
+        Close the cache.
+        """
+        if self.map:
+            self.map.close()
+            self.map = None
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    
+    
+    # Property Methods #########################################################
+    
+    def Get_Chromosomes(self):
+        """
+        Return a list of the chromosomes in the cache, in sorted order.
+        """
+        return list(self.chr_names)
+    
+    def Get_Size(self):
+        """
+        Return the number of records in the cache.
+        """
+        return self.records
+    
+    
+    
+    # Query Methods ############################################################
+    
+    def Get(self, name):
+        """
+        Return all the records with the given name.
+        
+        Return an empty list if there are no such records.
+        
+        Get(str) -> list<[str, int, int, str, str]>
+        """
+        results = []
+        if not self.slots: return results
+        mask = self.slots - 1
+        slot = zlib.crc32(name) & mask
+        while True:
+            index = STRUCT__slot.unpack_from(self.map,
+                    self.offset_index + slot*STRUCT__slot.size)[0]
+            if not index: return results
+            record = self._get_record(index - 1)
+            if record[3] == name: results.append(record)
+            slot = (slot + 1) & mask
+    
+    def Get_Overlaps(self, chr_, start, end):
+        """
+        Return all the records which overlap with the given coordinates, sorted
+        by their start and end. Coordinates are inclusive.
+        
+        Get_Overlaps(str, int, int) -> list<[str, int, int, str, str]>
+        """
+        results = []
+        entry = self.chromosomes.get(chr_, None)
+        if not entry: return results
+        chr_index, first, count, longest = entry
+        # Binary search for the first record which could overlap
+        low = first
+        high = first + count
+        minimum = start - longest
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_start(middle) < minimum: low = middle + 1
+            else: high = middle
+        # Scan
+        for i in range(low, first + count):
+            record = self._get_record(i)
+            if record[1] > end: break
+            if record[2] >= start: results.append(record)
+        return results
+    
+    def _get_start(self, index):
+        """
+        Return the start coordinate of the record at the given index.
+        """
+        return STRUCT__record.unpack_from(self.map,
+                self.offset_records + index*STRUCT__record.size)[3]
+    
+    def _get_record(self, index):
+        """
+        Return the record at the given index.
+        """
+        name_offset, name_length, chr_index, start, end, strand = (
+                STRUCT__record.unpack_from(self.map,
+                self.offset_records + index*STRUCT__record.size))
+        name = self._get_string(name_offset, name_length)
+        return [self.chr_names[chr_index], start, end, name, strand]
+    
+    def _get_string(self, offset, length):
+        """
+        Return a string from the string table.
+        """
+        offset += self.offset_strings
+        return self.map[offset:offset+length]
+    
+    
+    
+    # Printing Methods #########################################################
+    
+    def printE(self, string):
+        """
+        Print an error message.
+        """
+        print(string)
+
+
+
+# Functions ####################################################################
+
+def Write_Annotation_Cache(path_cache, records):
+    """
+    Write an annotation cache containing the given records.
+    
+    @path_cache
+            (str - filepath)
+            The filepath of the annotation cache to be written.
+    @records
+            (list<[str, int, int, str, str]>)
+            The records, in the same format as the rows of the BED file:
+                [chr, start, end, name, strand]
+            Coordinates must be 1-based and inclusive. The records do not need
+            to be sorted.
+    
+    Write_Annotation_Cache(str, list<[str, int, int, str, str]>) -> None
+    """
+    records = sorted(records)
+    strings = []
+    string_offset = 0
+    # Chromosome table
+    chr_table = []
+    chr_indexes = {}
+    for i in range(len(records)):
+        chr_, start, end, name, strand = records[i]
+        if chr_ not in chr_indexes:
+            chr_indexes[chr_] = len(chr_table)
+            chr_table.append([string_offset, len(chr_), i, 0, 0])
+            strings.append(chr_)
+            string_offset += len(chr_)
+        entry = chr_table[-1]
+        entry[3] += 1
+        if end - start > entry[4]: entry[4] = end - start
+    # Records
+    packed = []
+    for chr_, start, end, name, strand in records:
+        packed.append(STRUCT__record.pack(string_offset, len(name),
+                chr_indexes[chr_], start, end, strand[:1] or "."))
+        strings.append(name)
+        string_offset += len(name)
+    # Name index, at most half full
+    slots = 1
+    while slots < len(records)*2: slots *= 2
+    if not records: slots = 0
+    table = [0]*slots
+    mask = slots - 1
+    for i in range(len(records)):
+        slot = zlib.crc32(records[i][3]) & mask
+        while table[slot]: slot = (slot + 1) & mask
+        table[slot] = i + 1
+    # Offsets
+    offset_chr = STRUCT__header.size
+    offset_records = offset_chr + len(chr_table)*STRUCT__chr.size
+    offset_index = offset_records + len(records)*STRUCT__record.size
+    offset_strings = offset_index + slots*STRUCT__slot.size
+    # Write
+    o = open(path_cache, "wb")
+    o.write(STRUCT__header.pack(CONFIG__magic, CONFIG__version, len(records),
+            len(chr_table), slots, offset_chr, offset_records, offset_index,
+            offset_strings))
+    for entry in chr_table: o.write(STRUCT__chr.pack(*entry))
+    o.write("".join(packed))
+    o.write(struct.pack("<%dI" % slots, *table))
+    o.write("".join(strings))
+    o.close()
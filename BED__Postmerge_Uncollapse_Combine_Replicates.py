@@ -19,6 +19,9 @@ USAGE:
             <output_path_all_a> <output_path_all_t> <output_path_all_m>]
             [-u <output_path_uniques_p> <output_path_uniques_a>
             <output_path_uniques_t> <output_path_uniques_m>]
+            [-s <output_path_signatures>] [-r <replicate_thresholds>]
+            [-g <group_thresholds>] [-c <output_path_cooccurrence>]
+            [-t <output_path_table>] [-j <processes>]
 
 
 
@@ -87,6 +90,128 @@ OPTIONAL:[-m <output_path_main>]
                     least 1 count. 0 otherwise.
             [*_t] contains the total counts across all replicates.
             [*_m] contains the average number of counts per replicate.
+    
+    output_path_signatures
+        
+        (DEFAULT: None)
+        
+        The filepath of an output file containing the presence signature of
+        each row. This is a TSV with the genomic coordinates followed by two
+        integer bitsets:
+            GROUP_SIGNATURE     - One bit for each experimental group, in the
+                                  order of the grouping file. (The first group
+                                  is 1, the second group is 2, the third group
+                                  is 4, etc.) The bit is set if at least 1
+                                  replicate of the group contains at least 1
+                                  count.
+            REPLICATE_SIGNATURE - One bit for each column of each group, in the
+                                  order of the grouping file. The bit is set if
+                                  that replicate contains at least 1 count.
+        Rows can then be filtered using integer comparisons. For example, with
+        4 groups, a GROUP_SIGNATURE of 15 indicates presence in all groups, and
+        a GROUP_SIGNATURE of 4 indicates presence in the third group only.
+        If no filepath is specified, this file will not be produced.
+    
+    replicate_thresholds
+        
+        (DEFAULT: None)
+        
+        A comma-separated list of replicate-level presence thresholds. Each
+        threshold is either a number of replicates, or a percentage of the
+        replicates of each group, followed by a "%". Percentages are rounded up.
+        
+        For each threshold, an output file is produced, which contains either
+        a 1 or a 0 for each group. 1 if at least that many replicates of the
+        group contain at least 1 count. 0 otherwise. The filepath of the output
+        file is generated from the grouping file, and ends in:
+            __MIN_{threshold}_REPS
+        With "%" replaced by "PCT".
+    
+    group_thresholds
+        
+        (DEFAULT: None)
+        
+        A comma-separated list of group-level presence thresholds. Each
+        threshold is either a number of groups, or a percentage of the groups,
+        followed by a "%". Percentages are rounded up.
+        
+        For each threshold, an output file is produced, in the same format as
+        [output_path_main_p], which contains only the genetic elements found in
+        at least that many experimental groups. The filepath of the output file
+        is generated from the grouping file, and ends in:
+            __MIN_{threshold}_GROUPS
+        With "%" replaced by "PCT".
+        
+        All thresholds are evaluated in the same pass over the input file.
+    
+    output_path_cooccurrence
+        
+        (DEFAULT: None)
+        
+        The filepath of an output file containing, for each pair of
+        experimental groups, the number of genetic elements present in each
+        group, the number present in both groups, and the Jaccard index of the
+        two groups. (The number present in both, divided by the number present
+        in either) A genetic element is present in a group if at least 1
+        replicate contains at least 1 count.
+        If no filepath is specified, this file will not be produced.
+    
+    output_path_table
+        
+        (DEFAULT: None)
+        
+        The filepath of a single consolidated output file, to be produced
+        instead of the main, all-groups and unique outputs. (Which cannot be
+        specified alongside this option)
+        
+        This is a ZIP archive containing a compressed columnar table, with one
+        row per genetic element. The table is split into row groups, and each
+        column of each row group is stored as a separate compressed member,
+        named:
+            {row_group}/{column}
+        With both numbers 0-indexed and zero-padded to 6 and 4 digits. Any
+        column can therefore be read without reading any of the others.
+        
+        The members "schema.tsv" and "row_groups.tsv" list the columns and the
+        number of rows in each row group. Each column has one of the following
+        types:
+            str - Text, with one value per line.
+            B   - Unsigned 8-bit integers. (Flags, where 1 is true)
+            I   - Unsigned 32-bit integers.
+            i   - Signed 32-bit integers.
+            d   - 64-bit floating point numbers.
+        All numbers are stored as little-endian binary arrays, which can be
+        read directly by Python's array module, or NumPy. (numpy.frombuffer)
+        
+        The columns are:
+            chr, start, end                     - The genomic coordinates.
+            {group}_PRESENT                     - (B) Present in at least 1
+                                                  replicate of the group.
+            {group}_ALLREPS                     - (B) Present in all replicates
+                                                  of the group.
+            {group}_TOTAL                       - (I) The total counts.
+            {group}_AVERAGE                     - (d) The average counts.
+            ALLGROUPS_PRESENT, ALLGROUPS_ALLREPS
+                                                - (B) Present in all groups, in
+                                                  at least 1 replicate or in
+                                                  all replicates of each group.
+            UNIQUE_GROUP                        - (i) The index of the only
+                                                  group the genetic element is
+                                                  present in, or -1.
+            UNIQUE_ALLREPS                      - (B) Uniquely present in one
+                                                  group, in all of its
+                                                  replicates.
+    
+    processes
+        
+        (DEFAULT: 1)
+        
+        The number of processes used. If more than one process is used, the
+        input file is split into chunks at row boundaries, which are processed
+        in parallel. The results of each chunk are written to a temporary shard
+        file in the same folder as the outputs, and the shards are then copied
+        into the outputs in their original order, so the outputs are identical
+        to those produced by a single process.
 
 
 
@@ -102,6 +227,19 @@ EXAMPLES:
             present_all_totals.bed present_all_mean.bed -u uniquely_present
             uniquely_present_all_reps uniquely_present_totals
             unique_present_averages
+    
+    python27 BED__Postmerge_Uncollapse_Combine_Replicates.py
+            data\summary.bed data\list_of_groups.tsv -s signatures.bed
+    
+    python27 BED__Postmerge_Uncollapse_Combine_Replicates.py
+            data\summary.bed data\list_of_groups.tsv -r 2,50% -g 2,75%
+            -c shared_regions.tsv
+    
+    python27 BED__Postmerge_Uncollapse_Combine_Replicates.py
+            data\summary.bed data\list_of_groups.tsv -t combined.zip
+    
+    python27 BED__Postmerge_Uncollapse_Combine_Replicates.py
+            data\summary.bed data\list_of_groups.tsv -j 4
 
 USAGE:
     
@@ -111,6 +249,9 @@ USAGE:
             <output_path_all_a> <output_path_all_t> <output_path_all_m>]
             [-u <output_path_uniques_p> <output_path_uniques_a>
             <output_path_uniques_t> <output_path_uniques_m>]
+            [-s <output_path_signatures>] [-r <replicate_thresholds>]
+            [-g <group_thresholds>] [-c <output_path_cooccurrence>]
+            [-t <output_path_table>] [-j <processes>]
 """
 
 NAME = "BED__Postmerge_Uncollapse_Combine_Replicates.py"
@@ -141,6 +282,22 @@ FILEMOD__A = "_ALLREPS"
 FILEMOD__T = "_TOTALS"
 FILEMOD__M = "_AVERAGES"
 
+FILEMOD__REPS_THRESHOLD = "__MIN_{T}_REPS"
+FILEMOD__GROUPS_THRESHOLD = "__MIN_{T}_GROUPS"
+
+DEFAULT__block_size = 4096 # Number of rows processed at a time
+DEFAULT__row_group_size = 65536 # Rows per row group in the columnar table
+
+DEFAULT__processes = 1
+DEFAULT__chunks_per_process = 4 # Input chunks per process, in parallel mode
+DEFAULT__chunk_size = 16777216 # Max bytes per input chunk, in parallel mode
+
+FILEMOD__SHARD = ".shard"
+
+DEFAULT__max_handles = 64 # Max output files open at any one time
+DEFAULT__buffer_size = 1048576 # Bytes buffered per output file before writing
+DEFAULT__buffer_budget = 67108864 # Max bytes buffered across all output files
+
 
 
 # Imported Modules #############################################################
@@ -151,6 +308,221 @@ from _Command_Line_Parser import *
 from Table_File_Reader import *
 
 import random as Random
+import itertools
+import operator
+import collections
+import math
+import array
+import sys
+import zipfile
+import marshal
+import tempfile
+import multiprocessing
+
+
+
+# Classes ######################################################################
+
+class Writer_Pool:
+    """
+    A pool of buffered output files, which keeps at most [DEFAULT__max_handles]
+    files open at any one time, so the number of output files is not limited by
+    the number of files the operating system allows a process to have open.
+    
+    Writes are held in a memory buffer for each file, and are only written to
+    disk once the buffer reaches [DEFAULT__buffer_size] bytes, or the file is
+    closed. The total size of all the buffers is limited to
+    [DEFAULT__buffer_budget] bytes, so memory usage does not grow with the
+    number of files. When the limit is exceeded, the largest buffer is written
+    to disk. When a file needs to be opened and the limit has been reached, the
+    least recently used file is closed first. Files are reopened in append mode.
+    
+    Designed for the following use:
+    
+    pool = Writer_Pool()
+    o = pool.Open("F:/Filepath.bed")
+    o.write(text)
+    o.close()
+    """
+    
+    def __init__(self, max_handles=DEFAULT__max_handles,
+                buffer_budget=DEFAULT__buffer_budget,
+                buffer_size=DEFAULT__buffer_size):
+        """
+        Create an empty pool.
+        """
+        self.max_handles = max_handles
+        self.buffer_budget = buffer_budget
+        self.buffer_size = buffer_size
+        self.buffered = 0 # Total bytes buffered across all files
+        self.buffers = {} # {path: [list<str>, int]}
+        self.created = {} # Files which have been created or truncated
+        self.handles = collections.OrderedDict() # Least recently used first
+    
+    def Open(self, path):
+        """
+        Add a file to the pool and return a writer for it, with write() and
+        close() methods.
+        
+        Open(str) -> Pooled_Writer
+        """
+        self.buffers[path] = [[], 0]
+        return Pooled_Writer(self, path)
+    
+    def Write(self, path, text):
+        """
+        Write text to a file in the pool.
+        """
+        buffer_ = self.buffers[path]
+        buffer_[0].append(text)
+        buffer_[1] += len(text)
+        self.buffered += len(text)
+        if buffer_[1] >= self.buffer_size: self.Flush(path)
+        while self.buffered > self.buffer_budget:
+            self.Flush(max(self.buffers,
+                    key = lambda path_: self.buffers[path_][1]))
+    
+    def Flush(self, path):
+        """
+        Write the buffer of a file in the pool to disk.
+        """
+        buffer_ = self.buffers[path]
+        handle = self._get_handle(path)
+        handle.write("".join(buffer_[0]))
+        self.buffered -= buffer_[1]
+        buffer_[0] = []
+        buffer_[1] = 0
+    
+    def Close(self, path):
+        """
+        Write any remaining text to a file in the pool, and close it.
+        """
+        self.Flush(path)
+        self.handles.pop(path).close()
+        del self.buffers[path]
+    
+    def _get_handle(self, path):
+        """
+        Return an open handle for a file, opening it if necessary, and mark it
+        as the most recently used file.
+        """
+        handle = self.handles.pop(path, None)
+        if not handle:
+            if len(self.handles) >= self.max_handles:
+                self.handles.popitem(last = False)[1].close()
+            if path in self.created: handle = open(path, "a")
+            else:
+                handle = open(path, "w")
+                self.created[path] = True
+        self.handles[path] = handle
+        return handle
+
+class Pooled_Writer:
+    """
+    A file-like writer for a single file in a Writer_Pool.
+    """
+    
+    def __init__(self, pool, path):
+        """
+        Create a writer for a file in the pool.
+        """
+        self.pool = pool
+        self.path = path
+    
+    def write(self, text):
+        """
+        Write text to the file.
+        """
+        self.pool.Write(self.path, text)
+    
+    def close(self):
+        """
+        Write any remaining text to the file, and close it.
+        """
+        self.pool.Close(self.path)
+
+class Columnar_Writer:
+    """
+    A writer for a compressed columnar table, stored as a ZIP archive with one
+    compressed member for each column of each row group. (See the help
+    documentation for [output_path_table])
+    
+    Rows are added in blocks, as a list of columns, and are buffered until a
+    full row group of [DEFAULT__row_group_size] rows can be written.
+    
+    Designed for the following use:
+    
+    o = Columnar_Writer("F:/Filepath.zip", names, types)
+    o.Open()
+    o.Add(columns)
+    o.Close()
+    """
+    
+    def __init__(self, path, names, types,
+                row_group_size=DEFAULT__row_group_size):
+        """
+        Create a writer for a table with the given column names and types.
+        """
+        self.path = path
+        self.names = names
+        self.types = types
+        self.row_group_size = row_group_size
+        self.archive = None
+        self.buffers = [[] for name in names]
+        self.rows = 0
+        self.row_groups = []
+    
+    def Open(self):
+        """
+        Create the output file.
+        """
+        self.archive = zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED,
+                True)
+    
+    def Add(self, columns):
+        """
+        Add a block of rows to the table, as a list of columns.
+        """
+        for i in range(len(columns)):
+            self.buffers[i].extend(columns[i])
+        self.rows += len(columns[0])
+        if self.rows >= self.row_group_size: self._flush()
+    
+    def Close(self):
+        """
+        Write any remaining rows, and the table metadata, and close the file.
+        """
+        if self.rows: self._flush()
+        sb = STR__table_schema_header
+        for i in range(len(self.names)):
+            type_ = self.types[i]
+            if type_ == STR__table_str: size = 0
+            else: size = array.array(type_).itemsize
+            sb += "\t".join([str(i), self.names[i], type_, str(size)]) + "\n"
+        self.archive.writestr(STR__table_schema, sb)
+        sb = STR__table_row_groups_header
+        for i in range(len(self.row_groups)):
+            sb += "%d\t%d\n" % (i, self.row_groups[i])
+        self.archive.writestr(STR__table_row_groups, sb)
+        self.archive.close()
+    
+    def _flush(self):
+        """
+        Write the buffered rows as a row group.
+        """
+        index = len(self.row_groups)
+        for i in range(len(self.names)):
+            type_ = self.types[i]
+            if type_ == STR__table_str: data = Join_Lines(self.buffers[i])
+            else:
+                values = array.array(type_, self.buffers[i])
+                if sys.byteorder == "big": values.byteswap()
+                data = values.tostring()
+            self.archive.writestr(STR__table_member.format(G = index, C = i),
+                    data)
+            self.buffers[i] = []
+        self.row_groups.append(self.rows)
+        self.rows = 0
 
 
 
@@ -158,6 +530,18 @@ import random as Random
 
 STR__BED_header = "chr\tstart\tend"
 
+STR__signatures_header = "\tGROUP_SIGNATURE\tREPLICATE_SIGNATURE\n"
+
+STR__cooccurrence_header = ("GROUP_1\tGROUP_2\tGROUP_1_COUNT\tGROUP_2_COUNT\t"
+        "SHARED\tJACCARD\n")
+
+STR__table_member = "{G:06d}/{C:04d}"
+STR__table_schema = "schema.tsv"
+STR__table_schema_header = "INDEX\tNAME\tTYPE\tBYTES\n"
+STR__table_row_groups = "row_groups.tsv"
+STR__table_row_groups_header = "ROW_GROUP\tROWS\n"
+STR__table_str = "str"
+
 
 
 STR__use_help = "\nUse the -h option for help:\n\t python "\
@@ -173,6 +557,23 @@ in the main input file."""
 
 
 
+STR__invalid_processes = """
+ERROR: Invalid number of processes specified:
+    {s}
+Please specify a positive integer."""
+
+STR__table_conflict = """
+ERROR: The -t option cannot be used alongside the -m, -a or -u options."""
+
+
+
+STR__invalid_thresholds = """
+ERROR: Invalid thresholds: {s}
+Please specify a comma-separated list of positive integers and/or percentages
+followed by a "%"."""
+
+
+
 STR__metrics = """
                        Rows in input file: {A}
 
@@ -189,8 +590,22 @@ STR__metrics = """
 
 
 
+STR__metrics_reps = """
+    In at least {T} replicates of a group:
+    
+                            In all groups: {A}
+                     In exactly one group: {B}
+"""
+
+STR__metrics_groups = """
+    In at least {T} groups: {A}"""
+
+
+
 STR__combine_begin = "\nRunning Combine_Replicates..."
 
+STR__chunks = "\tSplit input file into {N} chunks..."
+
 STR__combine_complete = "\nCombine_Replicates successfully finished."
 
 
@@ -202,6 +617,16 @@ Do you wish to overwrite them in the event of a naming clash? (y/n): """
 
 
 
+# Dictionaries #################################################################
+
+DICT__int = {} # Cached int() of count strings
+DICT__str = {} # Cached str() of totals
+DICT__avg = {} # Cached averages as strings, per number of replicates
+
+DICT__flag_str = {True: "1", False: "0"}
+
+
+
 # Apply Globals ################################################################
 
 PRINT.PRINT_ERRORS = PRINT_ERRORS
@@ -212,7 +637,9 @@ PRINT.PRINT_METRICS = PRINT_METRICS
 
 # Functions ####################################################################
 
-def Combine_Replicates(path_in, path_groups, paths_out):
+def Combine_Replicates(path_in, path_groups, paths_out, path_signatures="",
+            rep_thresholds=[], group_thresholds=[], paths_thresholds=[[], []],
+            path_cooccurrence="", path_table="", processes=DEFAULT__processes):
     """
     Generate a series of FASTA files each containing a synthetic chromosome.
     
@@ -227,21 +654,54 @@ def Combine_Replicates(path_in, path_groups, paths_out):
     @paths_out
             (list<list<str>> - 8x filepaths, 4x dirpaths)
             Nested lists, containing the output filepaths and dirpaths.
+    @path_signatures
+            (str - filepath)
+            The filepath of the output file containing the presence signatures
+            of each row. An empty string indicates that no such file will be
+            produced.
+    @rep_thresholds
+            (list<[str, float, bool]>)
+            The replicate-level presence thresholds, as returned by
+            Parse_Thresholds. For each threshold, an output file is produced,
+            which indicates for each row and each group whether or not at least
+            that many replicates of the group contain at least 1 count.
+    @group_thresholds
+            (list<[str, float, bool]>)
+            The group-level presence thresholds, as returned by
+            Parse_Thresholds. For each threshold, an output file is produced,
+            which contains the rows present in at least that many groups.
+    @paths_thresholds
+            (list<list<str>> - filepaths)
+            The filepaths of the output files for the replicate-level
+            thresholds, and of the output files for the group-level thresholds.
+    @path_cooccurrence
+            (str - filepath)
+            The filepath of the output file containing the number of genetic
+            elements shared by each pair of groups, and their Jaccard indexes.
+            An empty string indicates that no such file will be produced.
+    @path_table
+            (str - filepath)
+            The filepath of the consolidated columnar table. If specified, this
+            table is produced instead of the outputs in [paths_out].
+    @processes
+            (int)
+            The number of processes used. If more than one process is used, the
+            input file is split into chunks at row boundaries, which are
+            processed in parallel, (See: Combine_Chunk) and the results are
+            written to the outputs in their original order.
     
     Return a value of 0 if the function runs successfully.
     Return a value of 1 if there is a problem.
     
     Combine_Replicates(str, str, [[str, str, str, str], [str, str, str, str],
-            [str, str, str, str]]) -> int
+            [str, str, str, str]], str, list<[str, float, bool]>,
+            list<[str, float, bool]>, [list<str>, list<str>], str, str, int) ->
+            int
     """
     PRINT.printP(STR__combine_begin)
     
     # Setup reporting
-    count_rows = 0
-    count_universal_one = 0
-    count_universal_all = 0
-    count_unique_one = 0
-    count_unique_all = 0
+    summary_metrics = [0]*(5 + 2*len(rep_thresholds) + len(group_thresholds))
     
     # Get groups
     processed_groups = Process_Groups(path_groups)
@@ -249,144 +709,699 @@ def Combine_Replicates(path_in, path_groups, paths_out):
     groups_list, groups_dict, empty_dicts_dict, lengths_dict = processed_groups
     
     # I/O setup
-    f = Table_Reader()
-    f.Set_New_Path(path_in)
-    f.Set_Delimiter("\t")
-    f.Close()
-            
     header_str = STR__BED_header
     for group in groups_list:
         header_str += "\t" + group
     header_str += "\n"
-    outputs = Setup_Outputs(paths_out, groups_dict, header_str)
+    table = None
+    outputs = []
+    if path_table:
+        names, types = Get_Table_Columns(groups_list)
+        table = Columnar_Writer(path_table, names, types)
+        table.Open()
+        folder = os.path.dirname(os.path.abspath(path_table))
+    else:
+        outputs = Setup_Outputs(paths_out, groups_dict, header_str)
+        folder = os.path.dirname(os.path.abspath(paths_out[0][0]))
+    s = None
+    if path_signatures:
+        s = open(path_signatures, "w")
+        s.write(STR__BED_header + STR__signatures_header)
+    matrix = []
+    if path_cooccurrence:
+        matrix = [[0]*len(groups_list) for group in groups_list]
+    outputs_thresholds = []
+    for paths in paths_thresholds:
+        temp = []
+        for path in paths:
+            file_writer = open(path, "w")
+            file_writer.write(header_str)
+            temp.append(file_writer)
+        outputs_thresholds.append(temp)
     
     # Main loop
-    f.Open()
-    while not f.EOF:
-        f.Read()
-        values = f.Get()
-        count_rows += 1
-        # Flags, totals and tallies, for ALL
-        flag_all_p = True
-        flag_all_a = True
-        dict_present = {}
-        dict_all = {}
-        dict_total = {}
-        dict_avgs = {}
-        groups_present = 0
-        last_group_present = ""
-        last_str = ""
-        # Per group
-        for group in groups_list:
-            # Flags, totals and tallies, per group
-            flag_p = False
-            flag_a = True
-            total = 0
-            col_nos = groups_dict[group]
-            # Sb
-            sb = ""
-            # Go over all replicates
-            for col in col_nos:
-                string = values[col]
-                # Stringbuilder
-                sb += "\t" + string
-                # Counts and flags
-                number = int(string)
-                if number:
-                    flag_p = True
-                    total += number
-                else:
-                    flag_a = False                
-            # For individuals
-            dict_total[group] = total
-            avg = total/lengths_dict[group]
-            dict_avgs[group] = avg
-            # Update dicts
-            if flag_p:
-                dict_present[group] = 1
-                #
-                groups_present += 1
-                last_group_present = group
-                last_str = sb
-            else:
-                flag_all_p = False
-                #
-                dict_present[group] = 0
-            if flag_a:
-                dict_all[group] = 1
-            else:
-                flag_all_a = False
-                #
-                dict_all[group] = 0
-        # Stringbuilder
-        coords = values[:3]
-        sb = "\t".join(coords)
-        sb_present = sb
-        sb_all = sb
-        sb_total = sb
-        sb_avg = sb
-        for group in groups_list:
-            present = dict_present[group]
-            sb_present += "\t" + str(present)
-            all_ = dict_all[group]
-            sb_all += "\t" + str(all_)
-            total = dict_total[group]
-            sb_total += "\t" + str(total)
-            avg = dict_avgs[group]
-            sb_avg += "\t" + str(avg)
-        sb_present += "\n"
-        sb_all += "\n"
-        sb_total += "\n"
-        sb_avg += "\n"
-        # Write
-        outputs[0][0].write(sb_present)
-        outputs[0][1].write(sb_all)
-        outputs[0][2].write(sb_total)
-        outputs[0][3].write(sb_avg)
-        if flag_all_p: # Main
-            count_universal_one += 1
-            outputs[1][0].write(sb_present)
-            outputs[1][2].write(sb_total)
-            outputs[1][3].write(sb_avg)
-        if flag_all_a: # All
-            count_universal_all += 1
-            outputs[1][1].write(sb_all)
-        if groups_present == 1: # Unique
-            count_unique_one += 1
-            group = last_group_present # The last one to be present
-            # Reiterating the data
-            sb_unique = sb + last_str + "\n"
-            outputs[2][0][group].write(sb_unique)
-            if dict_all[group] == 1:
-                count_unique_all += 1
-                outputs[2][1][group].write(sb_unique)
-            # Individual totals and averages
-            total = dict_total[group]
-            sb_unique_total = sb + "\t" + str(total) + "\n"
-            avg = dict_avgs[group]
-            sb_unique_avg = sb + "\t" + str(avg) + "\n"
-            outputs[2][2][group].write(sb_unique_total)
-            outputs[2][3][group].write(sb_unique_avg)
+    if processes > 1:
+        size = os.path.getsize(path_in)
+        chunks = Get_Chunks(path_in, max(processes*DEFAULT__chunks_per_process,
+                size/DEFAULT__chunk_size + 1))
+        PRINT.printP(STR__chunks.format(N = len(chunks)))
+        paths_shard = []
+        try:
+            jobs = []
+            for start, end in chunks:
+                handle, path_shard = tempfile.mkstemp(FILEMOD__SHARD, "",
+                        folder)
+                os.close(handle)
+                paths_shard.append(path_shard)
+                jobs.append([path_in, start, end, groups_list, groups_dict,
+                        lengths_dict, bool(s), rep_thresholds,
+                        group_thresholds, bool(matrix), bool(table),
+                        path_shard])
+            pool = multiprocessing.Pool(processes)
+            try:
+                for path_shard, metrics, chunk_matrix in pool.imap(
+                        Combine_Chunk, jobs):
+                    for texts, columns in Read_Shard(path_shard):
+                        Write_Texts(texts, columns, outputs, s,
+                                outputs_thresholds, table)
+                    os.remove(path_shard)
+                    summary_metrics = map(operator.add, summary_metrics,
+                            metrics)
+                    for i in range(len(matrix)):
+                        matrix[i] = map(operator.add, matrix[i],
+                                chunk_matrix[i])
+            except:
+                pool.terminate()
+                pool.join()
+                raise
+            pool.close()
+            pool.join()
+        finally:
+            # Shard files are always removed, even if a chunk failed
+            for path_shard in paths_shard:
+                if os.path.exists(path_shard): os.remove(path_shard)
+    else:
+        f = open(path_in, "U")
+        while True:
+            lines = list(itertools.islice(f, DEFAULT__block_size))
+            if not lines: break
+            rows = [line.rstrip("\n").split("\t") for line in lines if
+                    line.strip()]
+            if not rows: continue
+            # Process
+            texts, metrics, mask_counts, columns = Combine_Block(rows,
+                    groups_list, groups_dict, lengths_dict, bool(s),
+                    rep_thresholds, group_thresholds, bool(matrix),
+                    bool(table))
+            # Write
+            Write_Texts(texts, columns, outputs, s, outputs_thresholds, table)
+            # Metrics
+            summary_metrics = map(operator.add, summary_metrics, metrics)
+            if matrix: Update_Cooccurrence(matrix, mask_counts)
+        f.close()
     
     # Finish
-    f.Close()
-    for i in outputs[:2]:
+    if s: s.close()
+    for i in outputs_thresholds:
         for j in i:
             j.close()
-    for j in outputs[2]:
-        for group in groups_list:
-            j[group].close()
+    if table: table.Close()
+    else:
+        for i in outputs[:2]:
+            for j in i:
+                j.close()
+        for j in outputs[2]:
+            for group in groups_list:
+                j[group].close()
+    if matrix: Write_Cooccurrence(path_cooccurrence, groups_list, matrix)
     PRINT.printP(STR__combine_complete)
     
     # Reporting
-    Report_Metrics([count_rows, count_universal_one, count_universal_all,
-            count_unique_one, count_unique_all])
+    Report_Metrics(summary_metrics, rep_thresholds, group_thresholds)
     
     # Wrap up
     return 0
 
 
 
+def Combine_Chunk(job):
+    """
+    Combine the replicates of a chunk of the input file, for use by a process
+    pool. The chunk is processed in blocks, (See: Combine_Block) and the
+    results of each block are written to a temporary shard file, to be read
+    back with Read_Shard. The shard file is created, and removed, by the
+    caller.
+    
+    Return the filepath of the shard file, the summary metrics of the chunk, in
+    the format used by Report_Metrics, and the co-occurrence matrix of the
+    chunk. (An empty list if no co-occurrence matrix is required)
+    
+    @job
+            (list)
+            A list containing the filepath of the input file, the byte range of
+            the chunk, the groups_list, groups_dict and lengths_dict, the
+            arguments of Combine_Block which specify which outputs are
+            required, and the filepath of the shard file, which must already
+            exist.
+    
+    Combine_Chunk([str, int, int, list<str>, dict<str:list<int>>,
+            dict<str:float>, bool, list<[str, float, bool]>,
+            list<[str, float, bool]>, bool, bool, str]) ->
+            [str, list<int>, list<list<int>>]
+    """
+    (path_in, start, end, groups_list, groups_dict, lengths_dict, signatures,
+            rep_thresholds, group_thresholds, cooccurrence, columnar,
+            path_shard) = job
+    # Read
+    f = open(path_in, "rb")
+    f.seek(start)
+    lines = f.read(end - start).split("\n")
+    f.close()
+    rows = [line.rstrip("\r").split("\t") for line in lines if line.strip()]
+    del lines
+    # Process
+    summary_metrics = [0]*(5 + 2*len(rep_thresholds) + len(group_thresholds))
+    matrix = []
+    if cooccurrence: matrix = [[0]*len(groups_list) for group in groups_list]
+    o = open(path_shard, "wb")
+    for i in range(0, len(rows), DEFAULT__block_size):
+        texts, metrics, mask_counts, columns = Combine_Block(
+                rows[i:i+DEFAULT__block_size], groups_list, groups_dict,
+                lengths_dict, signatures, rep_thresholds, group_thresholds,
+                cooccurrence, columnar)
+        marshal.dump([texts, columns], o)
+        summary_metrics = map(operator.add, summary_metrics, metrics)
+        if matrix: Update_Cooccurrence(matrix, mask_counts)
+    o.close()
+    return [path_shard, summary_metrics, matrix]
+
+def Get_Chunks(path_in, chunks):
+    """
+    Split a file into roughly equal chunks, such that each chunk begins at the
+    start of a row and ends at the end of a row.
+    
+    Return a list of the byte ranges of the chunks, in order.
+    
+    @path_in
+            (str - filepath)
+            The filepath of the input file.
+    @chunks
+            (int)
+            The number of chunks to aim for. Fewer chunks may be returned if
+            the rows are long.
+    
+    Get_Chunks(str, int) -> list<[int, int]>
+    """
+    size = os.path.getsize(path_in)
+    boundaries = [0]
+    f = open(path_in, "rb")
+    for i in range(1, chunks):
+        target = (size*i)/chunks
+        if target <= boundaries[-1]: continue
+        f.seek(target)
+        f.readline() # Align to the start of a row
+        boundary = f.tell()
+        if boundary >= size: break
+        boundaries.append(boundary)
+    f.close()
+    boundaries.append(size)
+    return [[boundaries[i], boundaries[i+1]] for i in range(len(boundaries)-1)]
+
+def Read_Shard(path_shard):
+    """
+    Yield the results of each block in a shard file written by Combine_Chunk,
+    in the order they were written.
+    
+    @path_shard
+            (str - filepath)
+            The filepath of the shard file.
+    
+    Read_Shard(str) -> generator<[list, list<list>]>
+    """
+    f = open(path_shard, "rb")
+    try:
+        while True: yield marshal.load(f)
+    except EOFError:
+        pass
+    f.close()
+
+def Write_Texts(texts, columns, outputs, s, outputs_thresholds, table):
+    """
+    Write the results of a block, as returned by Combine_Block, to the
+    outputs.
+    
+    @texts
+            (list)
+            The text for each output, as returned by Combine_Block.
+    @columns
+            (list<list>)
+            The columns of the columnar table, as returned by Combine_Block.
+    @outputs
+            (list)
+            The outputs, as returned by Setup_Outputs. An empty list if the
+            columnar table is produced instead.
+    @s
+            (file)
+            The presence signatures output. None if it is not produced.
+    @outputs_thresholds
+            (list<list<file>>)
+            The replicate-level and group-level threshold outputs.
+    @table
+            (Columnar_Writer)
+            The columnar table. None if it is not produced.
+    
+    Write_Texts(list, list<list>, list, file, list<list<file>>,
+            Columnar_Writer) -> None
+    """
+    if table: table.Add(columns)
+    else:
+        for i in range(2):
+            for j in range(4):
+                outputs[i][j].write(texts[i][j])
+        for j in range(4):
+            for group in texts[2][j]:
+                outputs[2][j][group].write(texts[2][j][group])
+    if s: s.write(texts[3])
+    for i in range(2):
+        for j in range(len(outputs_thresholds[i])):
+            outputs_thresholds[i][j].write(texts[4][i][j])
+
+def Combine_Block(rows, groups_list, groups_dict, lengths_dict, signatures,
+            rep_thresholds=[], group_thresholds=[], cooccurrence=False,
+            columnar=False):
+    """
+    Combine the replicates of a block of rows from the input file, and return
+    the text to be written to each output file, along with the summary metrics
+    for the block.
+    
+    The block is processed column by column rather than row by row. The count
+    columns of each group are converted into integers once, and the totals of
+    the group are then calculated for all the rows of the block at once, by
+    reducing its columns pairwise.
+    
+    The presence of each row is stored as two integer bitsets, (See:
+    Get_Presence_Masks) one with a bit for each replicate, and one with a bit
+    for each group. Whether a row is present in a group, in all replicates of
+    a group, in all groups, or in exactly one group, are all then determined
+    using bitmask operations.
+    
+    @rows
+            (list<list<str>>)
+            The rows of the block, split into their columns.
+    @groups_list
+            (list<str>)
+            The names of the groups, in order.
+    @groups_dict
+            (dict<str:list<int>>)
+            The column numbers (0-indexed) of each group.
+    @lengths_dict
+            (dict<str:float>)
+            The number of columns of each group.
+    @signatures
+            (bool)
+            Whether or not to produce the text for the presence signatures
+            output.
+    @rep_thresholds
+            (list<[str, float, bool]>)
+            The replicate-level presence thresholds.
+    @group_thresholds
+            (list<[str, float, bool]>)
+            The group-level presence thresholds.
+    @cooccurrence
+            (bool)
+            Whether or not to count the rows with each group bitset.
+    @columnar
+            (bool)
+            Whether or not to produce the columns of the consolidated columnar
+            table, instead of the text for the main, all-groups and unique
+            outputs.
+    
+    Return the text for each output, organized in the same way as the outputs
+    returned by Setup_Outputs, (with the unique outputs only containing the
+    groups with any text) followed by the text for the presence signatures
+    output and the texts for the replicate-level and group-level threshold
+    outputs, the summary metrics of the block, in the format used by
+    Report_Metrics, the number of rows with each group bitset, if requested,
+    and the columns of the columnar table, if requested, in the order given by
+    Get_Table_Columns.
+    
+    Combine_Block(list<list<str>>, list<str>, dict<str:list<int>>,
+            dict<str:float>, bool, list<[str, float, bool]>,
+            list<[str, float, bool]>, bool, bool) -> [[list<str>, list<str>,
+            list<dict<str:str>>, str, [list<str>, list<str>]], list<int>,
+            dict<int:int>, list<list>]
+    """
+    size = len(rows)
+    columns = zip(*rows)
+    coords = map("\t".join, zip(columns[0], columns[1], columns[2]))
+    group_masks, all_groups, all_reps = Get_Presence_Masks(groups_list,
+            groups_dict)
+    # Totals, averages and replicate presence bitsets
+    columns_total = []
+    columns_avg = []
+    strs_total = []
+    strs_avg = []
+    reps_counts = []
+    reps_bits = [0]*size
+    bit = 1
+    for group in groups_list:
+        length = lengths_dict[group]
+        avg_cache = DICT__avg.setdefault(length, {})
+        counts = [Memo_Map(int, columns[col], DICT__int) for col in
+                groups_dict[group]]
+        totals = reduce(Add_Columns, counts)
+        flags = [map(operator.truth, column) for column in counts]
+        for column in flags:
+            reps_bits = map(operator.or_, reps_bits,
+                    map(operator.mul, column, [bit]*size))
+            bit <<= 1
+        if rep_thresholds: reps_counts.append(reduce(Add_Columns, flags))
+        if columnar:
+            columns_total.append(totals)
+            columns_avg.append(map(operator.truediv, totals, [length]*size))
+            continue
+        strs_total.append(Memo_Map(str, totals, DICT__str))
+        strs_avg.append(Memo_Map(lambda total: str(total/length), totals,
+                avg_cache))
+    # Group presence, from the replicate bitsets
+    columns_present = []
+    columns_all = []
+    strs_present = []
+    strs_all = []
+    groups_bits = [0]*size
+    groups_counts = [0]*size
+    for index in range(len(groups_list)):
+        mask = group_masks[index]
+        masked = map(operator.and_, reps_bits, [mask]*size)
+        present = map(operator.truth, masked)
+        all_ = map(operator.eq, masked, [mask]*size)
+        if columnar:
+            columns_present.append(present)
+            columns_all.append(all_)
+        if not columnar or group_thresholds:
+            strs_present.append(map(DICT__flag_str.__getitem__, present))
+        if not columnar:
+            strs_all.append(map(DICT__flag_str.__getitem__, all_))
+        groups_bits = map(operator.or_, groups_bits,
+                map(operator.mul, present, [1 << index]*size))
+        if group_thresholds:
+            groups_counts = map(operator.add, groups_counts, present)
+    flags_all_p = map(operator.eq, groups_bits, [all_groups]*size)
+    flags_all_a = map(operator.eq, reps_bits, [all_reps]*size)
+    # Main
+    lines_present = []
+    if strs_present: lines_present = map("\t".join, zip(coords, *strs_present))
+    texts_main = ["", "", "", ""]
+    texts_all = ["", "", "", ""]
+    if not columnar:
+        lines_all = map("\t".join, zip(coords, *strs_all))
+        lines_total = map("\t".join, zip(coords, *strs_total))
+        lines_avg = map("\t".join, zip(coords, *strs_avg))
+        texts_main = [Join_Lines(lines_present), Join_Lines(lines_all),
+                Join_Lines(lines_total), Join_Lines(lines_avg)]
+        # All
+        texts_all = [
+                Join_Lines(itertools.compress(lines_present, flags_all_p)),
+                Join_Lines(itertools.compress(lines_all, flags_all_a)),
+                Join_Lines(itertools.compress(lines_total, flags_all_p)),
+                Join_Lines(itertools.compress(lines_avg, flags_all_p))]
+    # Unique
+    uniques = [{}, {}, {}, {}]
+    count_unique_one = 0
+    count_unique_all = 0
+    unique_groups = [-1]*size
+    unique_all = [0]*size
+    for i in range(size):
+        bits = groups_bits[i]
+        if not bits or bits & (bits - 1): continue # Not exactly one group
+        count_unique_one += 1
+        index = bits.bit_length() - 1
+        mask = group_masks[index]
+        if columnar:
+            unique_groups[i] = index
+            if reps_bits[i] & mask == mask:
+                count_unique_all += 1
+                unique_all[i] = 1
+            continue
+        group = groups_list[index]
+        row = rows[i]
+        sb = coords[i]
+        sb_unique = sb + "\t" + "\t".join([row[col] for col in
+                groups_dict[group]]) + "\n"
+        uniques[0].setdefault(group, []).append(sb_unique)
+        if reps_bits[i] & mask == mask:
+            count_unique_all += 1
+            uniques[1].setdefault(group, []).append(sb_unique)
+        uniques[2].setdefault(group, []).append(sb + "\t" +
+                strs_total[index][i] + "\n")
+        uniques[3].setdefault(group, []).append(sb + "\t" +
+                strs_avg[index][i] + "\n")
+    for texts in uniques:
+        for group in texts: texts[group] = "".join(texts[group])
+    # Signatures
+    text_signatures = ""
+    if signatures:
+        text_signatures = Join_Lines(map("\t".join, zip(coords,
+                map(str, groups_bits), map(str, reps_bits))))
+    # Thresholds
+    groups = len(groups_list)
+    metrics_thresholds = []
+    texts_reps = []
+    for threshold in rep_thresholds:
+        strs_threshold = []
+        groups_met = [0]*size
+        for index in range(groups):
+            minimum = Resolve_Threshold(threshold,
+                    len(groups_dict[groups_list[index]]))
+            met = map(operator.ge, reps_counts[index], [minimum]*size)
+            strs_threshold.append(map(DICT__flag_str.__getitem__, met))
+            groups_met = map(operator.add, groups_met, met)
+        texts_reps.append(Join_Lines(map("\t".join,
+                zip(coords, *strs_threshold))))
+        metrics_thresholds += [groups_met.count(groups), groups_met.count(1)]
+    texts_groups = []
+    for threshold in group_thresholds:
+        minimum = Resolve_Threshold(threshold, groups)
+        met = map(operator.ge, groups_counts, [minimum]*size)
+        texts_groups.append(Join_Lines(itertools.compress(lines_present, met)))
+        metrics_thresholds.append(sum(met))
+    # Co-occurrence
+    mask_counts = {}
+    if cooccurrence:
+        for bits in groups_bits:
+            mask_counts[bits] = mask_counts.get(bits, 0) + 1
+    # Columnar table
+    table_columns = []
+    if columnar:
+        table_columns = [list(columns[0]), map(int, columns[1]),
+                map(int, columns[2])]
+        for index in range(groups):
+            table_columns += [columns_present[index], columns_all[index],
+                    columns_total[index], columns_avg[index]]
+        table_columns += [flags_all_p, flags_all_a, unique_groups, unique_all]
+    # Return
+    metrics = [size, sum(flags_all_p), sum(flags_all_a), count_unique_one,
+            count_unique_all] + metrics_thresholds
+    return [[texts_main, texts_all, uniques, text_signatures,
+            [texts_reps, texts_groups]], metrics, mask_counts, table_columns]
+
+def Get_Presence_Masks(groups_list, groups_dict):
+    """
+    Return the bitmasks used for the presence bitsets of each row.
+    
+    In a replicate bitset, each replicate of each group is assigned one bit, in
+    the order of the groups, and then in the order of the columns of each
+    group. In a group bitset, each group is assigned one bit, in the order of
+    the groups. The lowest bit is the first.
+    
+    Return a list of the replicate bitmask of each group, the group bitmask with
+    all groups present, and the replicate bitmask with all replicates present.
+    
+    @groups_list
+            (list<str>)
+            The names of the groups, in order.
+    @groups_dict
+            (dict<str:list<int>>)
+            The column numbers (0-indexed) of each group.
+    
+    Get_Presence_Masks(list<str>, dict<str:list<int>>) -> [list<int>, int, int]
+    """
+    group_masks = []
+    bit = 0
+    for group in groups_list:
+        length = len(groups_dict[group])
+        group_masks.append(((1 << length) - 1) << bit)
+        bit += length
+    all_groups = (1 << len(groups_list)) - 1
+    all_reps = (1 << bit) - 1
+    return [group_masks, all_groups, all_reps]
+
+def Get_Table_Columns(groups_list):
+    """
+    Return the names and types of the columns of the consolidated columnar
+    table. The types are either "str", or a type code of the array module.
+    
+    @groups_list
+            (list<str>)
+            The names of the groups, in order.
+    
+    Get_Table_Columns(list<str>) -> [list<str>, list<str>]
+    """
+    names = ["chr", "start", "end"]
+    types = [STR__table_str, "I", "I"]
+    for group in groups_list:
+        names += [group + "_PRESENT", group + "_ALLREPS", group + "_TOTAL",
+                group + "_AVERAGE"]
+        types += ["B", "B", "I", "d"]
+    names += ["ALLGROUPS_PRESENT", "ALLGROUPS_ALLREPS", "UNIQUE_GROUP",
+            "UNIQUE_ALLREPS"]
+    types += ["B", "B", "i", "B"]
+    return [names, types]
+
+def Update_Cooccurrence(matrix, mask_counts):
+    """
+    Update a co-occurrence matrix with the number of rows with each group
+    bitset. Each row is added to the entry for every pair of groups present in
+    it, including each group with itself.
+    
+    Only the upper triangle of the matrix is updated. (Where the index of the
+    first group is lower than or equal to that of the second group)
+    
+    @matrix
+            (list<list<int>>)
+            The co-occurrence matrix, of size (groups x groups).
+    @mask_counts
+            (dict<int:int>)
+            The number of rows with each group bitset.
+    
+    Update_Cooccurrence(list<list<int>>, dict<int:int>) -> None
+    """
+    for mask in mask_counts:
+        count = mask_counts[mask]
+        indexes = []
+        while mask:
+            lowest = mask & -mask
+            indexes.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        for i in range(len(indexes)):
+            row = matrix[indexes[i]]
+            for j in indexes[i:]:
+                row[j] += count
+
+def Write_Cooccurrence(path_out, groups_list, matrix):
+    """
+    Write a co-occurrence matrix to a TSV file. Each row of the file contains a
+    pair of groups, the number of genetic elements present in each group, the
+    number of genetic elements present in both groups, and the Jaccard index of
+    the two groups. (Shared / present in either)
+    
+    @path_out
+            (str - filepath)
+            The filepath of the output file.
+    @groups_list
+            (list<str>)
+            The names of the groups, in order.
+    @matrix
+            (list<list<int>>)
+            The co-occurrence matrix, as updated by Update_Cooccurrence.
+    
+    Write_Cooccurrence(str, list<str>, list<list<int>>) -> None
+    """
+    o = open(path_out, "w")
+    o.write(STR__cooccurrence_header)
+    groups = len(groups_list)
+    for i in range(groups):
+        for j in range(i + 1, groups):
+            count_1 = matrix[i][i]
+            count_2 = matrix[j][j]
+            shared = matrix[i][j]
+            either = count_1 + count_2 - shared
+            if either: jaccard = float(shared)/either
+            else: jaccard = 0.0
+            values = [groups_list[i], groups_list[j], str(count_1),
+                    str(count_2), str(shared), str(jaccard)]
+            o.write("\t".join(values) + "\n")
+    o.close()
+
+def Parse_Thresholds(string):
+    """
+    Parse a comma-separated list of presence thresholds. Each threshold is
+    either a positive integer, (a minimum number) or a percentage followed by
+    a "%". (a minimum proportion)
+    
+    Return a list of thresholds, each of which is a list containing the
+    original text, the value, and whether or not the value is a percentage.
+    Return None if any of the thresholds are invalid.
+    
+    Ex.
+        "2,50%" -> [["2", 2, False], ["50%", 50.0, True]]
+    
+    @string
+            (str)
+            The comma-separated list of thresholds.
+    
+    Parse_Thresholds(str) -> list<[str, float, bool]>
+    """
+    results = []
+    for text in string.split(","):
+        text = text.strip(" ")
+        if text[-1:] == "%":
+            value = Validate_Number(text[:-1])
+            if value == None or value <= 0 or value > 100: return None
+            results.append([text, value, True])
+        else:
+            value = Validate_Int_NonNeg(text)
+            if value < 1: return None
+            results.append([text, value, False])
+    return results
+
+def Resolve_Threshold(threshold, total):
+    """
+    Return the minimum number required to meet a presence threshold, out of
+    the total number specified. Percentages are rounded up, and the minimum is
+    always at least 1.
+    
+    @threshold
+            (list<[str, float, bool]>)
+            The threshold, as returned by Parse_Thresholds.
+    @total
+            (int)
+            The total number of replicates or groups.
+    
+    Resolve_Threshold([str, float, bool], int) -> int
+    """
+    text, value, percentage = threshold
+    if not percentage: return value
+    minimum = int(math.ceil(round(value*total/100.0, 9)))
+    return max(minimum, 1)
+
+def Memo_Map(function, column, cache):
+    """
+    Apply a function to every element of a column, using a cache of previous
+    results. Much faster than calling the function on every element, when the
+    column contains relatively few distinct values, such as counts.
+    
+    @function
+            (function)
+            The function to be applied.
+    @column
+            (list)
+            The elements to apply the function to.
+    @cache
+            (dict)
+            The cache of previous results, which will be updated with any new
+            results.
+    
+    Memo_Map(function, list, dict) -> list
+    """
+    try:
+        return map(cache.__getitem__, column)
+    except KeyError:
+        for element in set(column):
+            if element not in cache: cache[element] = function(element)
+        return map(cache.__getitem__, column)
+
+def Add_Columns(column_1, column_2):
+    """
+    Return the element-wise sums of two columns of integers.
+    
+    Add_Columns(list<int>, list<int>) -> list<int>
+    """
+    return map(operator.add, column_1, column_2)
+
+def Join_Lines(lines):
+    """
+    Join a series of lines into a single block of text, with each line ending
+    in a newline.
+    
+    Join_Lines(list<str>) -> str
+    """
+    lines = list(lines)
+    if not lines: return ""
+    return "\n".join(lines) + "\n"
+
+
+
 def Process_Groups(path_groups):
     """
     Process a "groups" file to obtain the relevant data for the analysis.
@@ -464,6 +1479,10 @@ def Setup_Outputs(paths_out, groups_dict, header_str):
     Setup all the necessary output files and organize them into nested lists and
     dictionaries which can be systematically accessed.
     
+    The output files are all buffered writers in a single Writer_Pool, so only
+    a limited number of them are open at any one time, regardless of the
+    number of groups.
+    
     @paths_out
             (list<list<str>> - 8x filepaths, 4x dirpaths)
             Nested lists, containing the output filepaths and dirpaths.
@@ -476,15 +1495,17 @@ def Setup_Outputs(paths_out, groups_dict, header_str):
             The column headers of the first three columns of a BED file. The
             [header_str] is written directly to some input files.
     
-    Setup_Outputs(list<list<str>>, dict<str:list<int>>, str) -> [list<file>,
-            list<file>, list<dict<str:file>>]
+    Setup_Outputs(list<list<str>>, dict<str:list<int>>, str) ->
+            [list<Pooled_Writer>, list<Pooled_Writer>,
+            list<dict<str:Pooled_Writer>>]
     """
+    pool = Writer_Pool()
     result = []
     # MAIN and ALL
     for i in paths_out[:2]:
         temp = []
         for j in i:
-            file_writer = open(j, "w")
+            file_writer = pool.Open(j)
             file_writer.write(header_str)
             temp.append(file_writer)
         result.append(temp)
@@ -494,14 +1515,14 @@ def Setup_Outputs(paths_out, groups_dict, header_str):
         temp = {}
         for group in groups_dict:
             file_path = j + "\\" + group + ".bed"
-            file_writer = open(file_path, "w")
+            file_writer = pool.Open(file_path)
             temp[group] = file_writer
         uniques.append(temp)
     result.append(uniques)
     # Return
     return result
 
-def Report_Metrics(summary_metrics):
+def Report_Metrics(summary_metrics, rep_thresholds=[], group_thresholds=[]):
     """
     Print a report into the command line interface of the metrics of the
     operation.
@@ -518,6 +1539,17 @@ def Report_Metrics(summary_metrics):
                         in at least one replicate per group
                 - The number of genetic elements present in exactly one group,
                         in all replicates for that group
+                - For each replicate-level threshold, the number of genetic
+                        elements meeting that threshold in all groups, and in
+                        exactly one group
+                - For each group-level threshold, the number of genetic
+                        elements meeting that threshold
+    @rep_thresholds
+            (list<[str, float, bool]>)
+            The replicate-level presence thresholds.
+    @group_thresholds
+            (list<[str, float, bool]>)
+            The group-level presence thresholds.
                 
     count_rows = 0
     count_universal_one = 0
@@ -540,9 +1572,21 @@ def Report_Metrics(summary_metrics):
     count_unique_one = metric_strs_padded[3]
     count_unique_all = metric_strs_padded[4]
     # Print
-    PRINT.printM(STR__metrics.format(A = count_rows, B = count_universal_one,
+    sb = STR__metrics.format(A = count_rows, B = count_universal_one,
             C = count_universal_all, D = count_unique_one,
-            E = count_unique_all))
+            E = count_unique_all)
+    index = 5
+    for threshold in rep_thresholds:
+        sb += STR__metrics_reps.format(T = threshold[0],
+                A = metric_strs_padded[index],
+                B = metric_strs_padded[index + 1])
+        index += 2
+    for threshold in group_thresholds:
+        sb += STR__metrics_groups.format(T = threshold[0],
+                A = metric_strs_padded[index])
+        index += 1
+    if group_thresholds: sb += "\n"
+    PRINT.printM(sb)
 
 
 
@@ -613,13 +1657,22 @@ def Parse_Command_Line_Input__Combine_Uncollapsed(raw_command_line_input):
             temp.append(path_temp)
         paths_out.append(temp)
     Generate_Default_Output_Folder_Path
+    path_signatures = ""
+    rep_thresholds = []
+    group_thresholds = []
+    path_cooccurrence = ""
+    path_table = ""
+    text_outputs = False
+    processes = DEFAULT__processes
     
     # Validate optional inputs (except output path)
     while inputs:
         arg = inputs.pop(0)
         flag = 0
         try: # Following arguments
-            if arg in ["-m", "-a", "-u"]:
+            if arg in ["-s", "-r", "-g", "-c", "-t", "-j"]:
+                arg2 = inputs.pop(0)
+            elif arg in ["-m", "-a", "-u"]:
                 arg2 = inputs.pop(0)
                 arg3 = inputs.pop(0)
                 arg4 = inputs.pop(0)
@@ -633,14 +1686,76 @@ def Parse_Command_Line_Input__Combine_Uncollapsed(raw_command_line_input):
             PRINT.printE(STR__insufficient_inputs)
             PRINT.printE(STR__use_help)
             return 1
+        if arg in ["-m", "-a", "-u"]: text_outputs = True
         if arg == "-m":
             paths_out[0] = [arg2, arg3, arg4, arg5]
         elif arg == "-a":
             paths_out[1] = [arg2, arg3, arg4, arg5]
+        elif arg == "-s":
+            path_signatures = arg2
+        elif arg == "-c":
+            path_cooccurrence = arg2
+        elif arg == "-t":
+            path_table = arg2
+        elif arg == "-j":
+            processes = Validate_Int_NonNeg(arg2)
+            if processes < 1:
+                PRINT.printE(STR__invalid_processes.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg in ["-r", "-g"]:
+            thresholds = Parse_Thresholds(arg2)
+            if thresholds == None:
+                PRINT.printE(STR__invalid_thresholds.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+            if arg == "-r": rep_thresholds = thresholds
+            else: group_thresholds = thresholds
         else: # arg == "-u"
             paths_out[2] = [arg2, arg3, arg4, arg5]
     
+    if path_table and text_outputs:
+        PRINT.printE(STR__table_conflict)
+        PRINT.printE(STR__use_help)
+        return 1
+    
+    # Threshold output paths
+    paths_thresholds = [[], []]
+    for threshold in rep_thresholds:
+        mod = FILEMOD__REPS_THRESHOLD.format(T = threshold[0].replace("%",
+                "PCT"))
+        paths_thresholds[0].append(Generate_Default_Output_File_Path_From_File(
+                path_groups, mod, True))
+    for threshold in group_thresholds:
+        mod = FILEMOD__GROUPS_THRESHOLD.format(T = threshold[0].replace("%",
+                "PCT"))
+        paths_thresholds[1].append(Generate_Default_Output_File_Path_From_File(
+                path_groups, mod, True))
+    
     # Validate output paths
+    paths = paths_thresholds[0] + paths_thresholds[1]
+    if path_cooccurrence: paths.append(path_cooccurrence)
+    if path_table:
+        paths.append(path_table)
+        paths_out = [[], [], []]
+    for path in paths:
+        valid_out = Validate_Write_Path__FILE(path)
+        if valid_out == 2: return 0
+        if valid_out == 3:
+            PRINT.printE(STR__IO_error_write_forbid)
+            return 1
+        if valid_out == 4:
+            PRINT.printE(STR__In_error_write_unable)
+            return 1
+    if path_signatures:
+        valid_out = Validate_Write_Path__FILE(path_signatures)
+        if valid_out == 2: return 0
+        if valid_out == 3:
+            PRINT.printE(STR__IO_error_write_forbid)
+            return 1
+        if valid_out == 4:
+            PRINT.printE(STR__In_error_write_unable)
+            return 1
     for i in paths_out[:2]:
         for j in i:
             valid_out = Validate_Write_Path__FILE(j)
@@ -680,7 +1795,9 @@ def Parse_Command_Line_Input__Combine_Uncollapsed(raw_command_line_input):
                     return 1
     
     # Run program
-    exit_state = Combine_Replicates(path_in, path_groups, paths_out)
+    exit_state = Combine_Replicates(path_in, path_groups, paths_out,
+            path_signatures, rep_thresholds, group_thresholds,
+            paths_thresholds, path_cooccurrence, path_table, processes)
     
     # Exit
     if exit_state == 0: return 0
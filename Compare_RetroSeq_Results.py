@@ -12,7 +12,8 @@ USAGE:
     
     python27 Compare_RetroSeq_Results.py <baseline_file> <calls_folder>
             <chromosomes_file> [-o <output_file>] [-c <classification>]
-            [-v <values>] [-t <tiebreaker>]
+            [-v <values>] [-t <tiebreaker>] [-b <backend>] [-p <processes>]
+            [-k <cache>]
 
 
 
@@ -117,6 +118,40 @@ OPTIONAL:
             2:  (Partial) If at least one of the calls is the correct Family or
                 Subfamily, that TE will be given a partial score.
             3:  (None) Ties will be treated as FAILs.
+    
+    backend
+        
+        (DEFAULT: 1 - Stream)
+        
+        How the RetroSeq Calls files are read. There are 2 options:
+            1:  (Stream) The calls files are read alongside the baseline file,
+                in a single pass. The calls files must be sorted in the same
+                chromosome order as the chromosomes file, and the baseline file
+                must be sorted in the same order. Baseline sites which are out
+                of order will not be matched with any calls.
+            2:  (Index) Each calls file is loaded into memory, and the calls
+                for each baseline site are found with a binary search. Neither
+                the calls files nor the baseline file need to be sorted. Uses
+                more memory.
+    
+    processes
+        
+        (DEFAULT: 1)
+        
+        The number of processes used. The calls files are split into as many
+        subsets as there are processes, and each subset is compared against the
+        baseline file in parallel. The results are combined into the same
+        output file as a single process would produce.
+    
+    cache
+        
+        (DEFAULT: N)
+        
+        Whether or not to cache the contents of each calls file in a binary
+        file alongside it, (with the file extension ".rscache") for faster
+        loading in subsequent runs. Cache files are only used if the calls
+        file has not been modified since the cache was written, and are
+        otherwise rebuilt. Requires the Index backend.
 
     
 
@@ -154,12 +189,22 @@ EXAMPLES:
     
     python27 Compare_RetroSeq_Results.py Path/rmsk_rearranged.tsv Path/Calls
             Path/chr_sizes.tsv -o Path/Lenient_Compare.tsv -c 4 -v 1 -t 1
+    
+    python27 Compare_RetroSeq_Results.py Path/rmsk_unsorted.tsv Path/Calls
+            Path/chr_sizes.tsv -o Path/Detailed_Compare.tsv -b index
+    
+    python27 Compare_RetroSeq_Results.py Path/rmsk_rearranged.tsv Path/Calls
+            Path/chr_sizes.tsv -o Path/Detailed_Compare.tsv -p 8
+    
+    python27 Compare_RetroSeq_Results.py Path/rmsk_rearranged.tsv Path/Calls
+            Path/chr_sizes.tsv -o Path/Harsh_Compare.tsv -c 1 -b index -k Y
 
 USAGE:
     
     python27 Compare_RetroSeq_Results.py <baseline_file> <calls_folder>
             <chromosomes_file> [-o <output_file>] [-c <classification>]
-            [-v <values>] [-t <tiebreaker>]
+            [-v <values>] [-t <tiebreaker>] [-b <backend>] [-p <processes>]
+            [-k <cache>]
 """
 
 NAME = "Compare_RetroSeq_Results.py"
@@ -182,6 +227,7 @@ PRINT_METRICS = True
 # Minor Configurations #########################################################
 
 FILEMOD = "__RetroSeq_Compare.tsv"
+FILEMOD__SHARD = ".shard"
 
 
 
@@ -191,6 +237,9 @@ FILEMOD = "__RetroSeq_Compare.tsv"
 DEFAULT__Classification = 4 # Perfect/Family/Skip/Fail
 DEFAULT__Values = 1 # Flags
 DEFAULT__Tiebreaker = 2 # Partial
+DEFAULT__Backend = 1 # Stream
+DEFAULT__Processes = 1
+DEFAULT__Cache = False
 
 
 
@@ -198,6 +247,10 @@ DEFAULT__Tiebreaker = 2 # Partial
 
 import sys
 import os
+import array
+import operator
+import tempfile
+import multiprocessing
 
 
 
@@ -227,6 +280,15 @@ class TIEBREAKER:
     PARTIAL=2
     NONE=3
 
+class BACKEND:
+    STREAM=1
+    INDEX=2
+
+class MATCH:
+    NONE=0
+    PARTIAL=1
+    PERFECT=2
+
 class FLAG:
     SUCCESS=1
     SKIP=2
@@ -263,6 +325,23 @@ STR__invalid_tiebreaker = """
 ERROR: Invalid tiebreaker method specified:
     {S}"""
 
+STR__invalid_backend = """
+ERROR: Invalid backend specified:
+    {S}"""
+
+STR__invalid_processes = """
+ERROR: Invalid number of processes specified:
+    {S}
+Please specify a positive integer."""
+
+STR__invalid_cache = """
+ERROR: Invalid cache option specified:
+    {S}
+Please specify Y or N."""
+
+STR__cache_requires_index = """
+ERROR: Caching the calls files requires the Index backend. (-b index)"""
+
 STR__insufficient_columns = """
 ERROR: Insufficient columns in coordinates file. The coordinates file should
 contain at least 6 columns, the first 3 of which contain genome coordinates,
@@ -293,6 +372,8 @@ STR__compare_begin = "\nRunning Compare_RetroSeq_Results..."
 
 STR__compare_complete = "\nCompare_RetroSeq_Results successfully finished."
 
+STR__subsets = "\tSplit calls files into {N} subsets..."
+
 
 
 STR__unexpected_failure = "\nProgram exited with an unexpected error."
@@ -322,10 +403,15 @@ LIST__FULL = ["F", "f", "FULL", "Full", "full", "1"]
 LIST__PARTIAL = ["P", "p", "PARTIAL", "Partial", "partial", "2"]
 LIST__NONE = ["N", "n", "NONE", "None", "none", "3"]
 
+LIST__STREAM = ["S", "s", "STREAM", "Stream", "stream", "1"]
+LIST__INDEX = ["I", "i", "INDEX", "Index", "index", "2"]
+
 
 
 # Dictionaries #################################################################
 
+DICT__match = {} # {(name, family_1, family_2): {called: Match_Call result}}
+
 DICT__Values = {
     CLASSIFICATION.PASS_FAIL: {
         VALUES.FLAGS: {
@@ -609,7 +695,9 @@ PRINT.PRINT_METRICS = PRINT_METRICS
 # Functions ####################################################################
 
 def Compare_RetroSeq_Results__STR(baseline_file, calls_folder, chromosomes_file,
-        output_file, classification, output_values, tiebreaker):
+        output_file, classification, output_values, tiebreaker,
+        backend=DEFAULT__Backend, processes=DEFAULT__Processes,
+        cache=DEFAULT__Cache):
     """
     Compare the results of multiple datasets, which have gone through the
     RetroSeq pipeline, against the original TE coordinates and output the
@@ -666,14 +754,30 @@ def Compare_RetroSeq_Results__STR(baseline_file, calls_folder, chromosomes_file,
                 1:  Full points (treated the same as a perfect call)
                 2:  Partial points
                 3:  No points (treated the same as a failed call)
+    @backend
+            (int) - Pseudo ENUM
+            How the RetroSeq Calls files are read. There are 2 options:
+                1:  Stream - RetroSeq_Calls_Reader. All files must be sorted in
+                    the chromosome order of the chromosomes list file.
+                2:  Index - RetroSeq_Calls_Index. No sorting is required.
+    @processes
+            (int)
+            The number of processes used. The calls files are split into
+            subsets, which are compared against the baseline file in parallel.
+    @cache
+            (bool)
+            Whether or not to load the calls files from, and save them to,
+            binary cache files. Only used by the Index backend.
     
-    Compare_RetroSeq_Results__STR(str, str, str, str, int, int, int) -> int
+    Compare_RetroSeq_Results__STR(str, str, str, str, int, int, int, int, int,
+            bool) -> int
     """
     vcf_files = Get_VCF_From_Folder(calls_folder)
     if not vcf_files: return 1
     list_of_chrs = Get_Chrs_From_File(chromosomes_file)
     exit_code = Compare_RetroSeq_Results__LIST(baseline_file, vcf_files,
-        list_of_chrs, output_file, classification, output_values, tiebreaker)
+        list_of_chrs, output_file, classification, output_values, tiebreaker,
+        backend, processes, cache)
     return 0
 
 def Get_VCF_From_Folder(dirpath):
@@ -725,27 +829,33 @@ def Get_Chrs_From_File(filepath):
     return result    
     
 def Compare_RetroSeq_Results__LIST(baseline_file, calls_files, list_of_chrs,
-        output_file, classification, output_values, tiebreaker):
+        output_file, classification, output_values, tiebreaker,
+        backend=DEFAULT__Backend, processes=DEFAULT__Processes,
+        cache=DEFAULT__Cache):
     """
     Identical to the function {Compare_RetroSeq_Results__STR}, except that
     function takes a filepath for the chromosomes list file as an input, while
     this function takes a list of chromosomes instead for that input.
     
-    Compare_RetroSeq_Results__LIST(str, str, list<str>, str, int, int, int)
-            -> int
+    The calls files are split into as many subsets as there are processes, and
+    each subset is evaluated against the full baseline file by a separate
+    process. (See: Evaluate_Calls_Files) The columns of values produced by each
+    process are then combined, in order, into the output file.
+    
+    Compare_RetroSeq_Results__LIST(str, str, list<str>, str, int, int, int,
+            int, int, bool) -> int
     """
     PRINT.printP(STR__compare_begin)
     
     # Pre-calculate
     length = len(calls_files)
-    range_ = range(length)
     
     # Setup reporting
     sites = 0
     site_max_perfect = 0
     site_max_partial = 0
-    files_perfect = [0]*length
-    files_partial = [0]*length
+    files_perfect = []
+    files_partial = []
     
     # Setup the I/O (1)
     b = Table_Reader(baseline_file)
@@ -763,113 +873,298 @@ def Compare_RetroSeq_Results__LIST(baseline_file, calls_files, list_of_chrs,
         PRINT.printE(STR__insufficient_columns)
         return 1
     
-    # Setup the I/O (2)
-    files = [RetroSeq_Calls_Reader(f) for f in calls_files]
+    # Evaluate
+    folder = os.path.dirname(os.path.abspath(output_file))
+    subsets = min(processes, len(calls_files))
+    paths_shard = []
+    shards = []
+    try:
+        jobs = []
+        for i in range(subsets):
+            subset = calls_files[len(calls_files)*i/subsets:
+                    len(calls_files)*(i+1)/subsets]
+            handle, path_shard = tempfile.mkstemp(FILEMOD__SHARD, "", folder)
+            os.close(handle)
+            paths_shard.append(path_shard)
+            jobs.append([baseline_file, subset, list_of_chrs, classification,
+                    output_values, tiebreaker, backend, cache, path_shard])
+        if subsets > 1:
+            PRINT.printP(STR__subsets.format(N = subsets))
+            pool = multiprocessing.Pool(subsets)
+            try:
+                results = pool.map(Evaluate_Calls_Files, jobs)
+            except:
+                pool.terminate()
+                pool.join()
+                raise
+            pool.close()
+            pool.join()
+        else:
+            results = [Evaluate_Calls_Files(job) for job in jobs]
+        
+        # Setup the I/O (2)
+        sites_perfect = []
+        sites_partial = []
+        for path_shard, perfect, partial, site_perfect, site_partial in (
+                results):
+            shards.append(open(path_shard, "U"))
+            files_perfect += perfect
+            files_partial += partial
+            if not sites_perfect:
+                sites_perfect = list(site_perfect)
+                sites_partial = list(site_partial)
+            else:
+                sites_perfect = map(operator.add, sites_perfect, site_perfect)
+                sites_partial = map(operator.add, sites_partial, site_partial)
+        if sites_perfect:
+            site_max_perfect = max(sites_perfect)
+            site_max_partial = max(sites_partial)
+        o = open(output_file ,"w")
+        
+        # Header (2)
+        while extras > 0:
+            headers.append("#")
+            extras -= 1
+        for f in calls_files:
+            filename = Get_File_Name(f)
+            headers.append(filename)
+        sb = "\t".join(headers) + "\n"
+        o.write(sb)
+        
+        # Main loop
+        b.Open()
+        while not b.End():
+            sites += 1
+            # Read
+            b.Read()
+            values = b.Get_Current()
+            for shard in shards:
+                values.append(shard.readline().rstrip("\n"))
+            # Write
+            sb = "\t".join(values) + "\n"
+            o.write(sb)
+        
+        # Close up
+        b.Close()
+        o.close()
+    finally:
+        # Shard files are always removed, even if evaluation failed
+        for shard in shards:
+            shard.close()
+        for path_shard in paths_shard:
+            if os.path.exists(path_shard): os.remove(path_shard)
+    
+    PRINT.printP(STR__compare_complete)
+    
+    # Reporting
+    Report_Metrics(sites, site_max_perfect, site_max_partial, files_perfect,
+            files_partial)
+    sites = 0
+    site_max_perfect = 0
+    site_max_partial = 0
+    files_perfect = [0]*length
+    files_partial = [0]*length
+    
+    # Wrap up
+    return 0
+
+
+
+def Evaluate_Calls_Files(job):
+    """
+    Evaluate a subset of the RetroSeq Calls files against every TE site in the
+    baseline file, for use by a process pool.
+    
+    The values for each site are written to a temporary shard file, as one row
+    of tab-separated values per site, with one value per calls file. The shard
+    file is created, and removed, by the caller.
+    
+    Return the filepath of the shard file, the number of perfect calls and the
+    number of perfect or partial calls for each calls file, and the number of
+    calls files with a perfect call, and with a perfect or partial call, for
+    each site.
+    
+    @job
+            (list)
+            A list containing the filepath of the baseline file, the filepaths
+            of the calls files, the list of chromosomes, the classification,
+            output values, tiebreaker and backend modes, whether or not to use
+            cache files, and the filepath of the shard file, which must
+            already exist.
+    
+    Evaluate_Calls_Files([str, list<str>, list<str>, int, int, int, int, bool,
+            str]) -> [str, list<int>, list<int>, array<int>, array<int>]
+    """
+    (baseline_file, calls_files, list_of_chrs, classification, output_values,
+            tiebreaker, backend, cache, path_shard) = job
+    
+    # Pre-calculate
+    length = len(calls_files)
+    range_ = range(length)
+    scores = DICT__Values[classification][output_values][tiebreaker]
+    
+    # Setup reporting
+    files_perfect = [0]*length
+    files_partial = [0]*length
+    sites_perfect = array.array("i")
+    sites_partial = array.array("i")
+    
+    # Setup the I/O
+    b = Table_Reader(baseline_file)
+    b.Set_Delimiter("\t")
+    if backend == BACKEND.INDEX:
+        files = [RetroSeq_Calls_Index(f) for f in calls_files]
+        for f in files:
+            f.Set_Cache(cache)
+    else:
+        files = [RetroSeq_Calls_Reader(f) for f in calls_files]
     for f in files:
         f.Create_Chr_Order(list_of_chrs)
     for f in files:
         f.Open()
-    o = open(output_file ,"w")
-    
-    # Header (2)
-    while extras > 0:
-        headers.append("#")
-        extras -= 1
-    for f in calls_files:
-        filename = Get_File_Name(f)
-        headers.append(filename)
-    sb = "\t".join(headers) + "\n"
-    o.write(sb)
+    o = open(path_shard, "w")
     
     # Main loop
     b.Open()
     while not b.End():
-        sites += 1
         # Read
         b.Read()
         values = b.Get_Current()
-        chr_ = values[0]
-        start = int(values[1])
-        end = int(values[2])
+        coords = [values[0], int(values[1]), int(values[2])]
         name = values[3].upper()
         family_1 = values[4]
         family_2 = values[5]
-        coords = [chr_, start, end]
+        matches = DICT__match.setdefault((name, family_1, family_2), {})
         # Setup
         perfect = 0
         partial = 0
+        results = []
         # For all RetroSeq Calls files
         for i in range_:
             f = files[i]
             f.Read_Until(coords)
-            best = f.Get_Best()
-            calls = len(best)
-            count = 0
-            flag = FLAG.SKIP
-            if calls == 0: pass
-            elif calls == 1:
-                c_chr_, c_start, c_count, c_name = best[0]
-                c_name = c_name.upper()
-                count = c_count
-                if c_name == name: # Perfect
-                    # Stats
-                    perfect += 1
-                    partial += 1
-                    files_perfect[i] += 1
-                    files_partial[i] += 1
-                    # Flag
-                    flag = FLAG.SUCCESS                 
-                elif Partial_Match(name, family_1, family_2, c_name): # Partial
-                    # Stats
-                    partial += 1
-                    files_partial[i] += 1
-                    # Flag
-                    flag = FLAG.FAMILY
-                else:
-                    flag = FLAG.FAIL
-            else:
-                for call in best:
-                    c_chr_, c_start, c_count, c_name = call
-                    c_name = c_name.upper()
-                    if c_name == name:
-                        flag = FLAG.TIED_SUCCESS
-                        count = c_count
-                    elif Partial_Match(name, family_1, family_2, c_name):
-                        if flag != FLAG.TIED_SUCCESS:
-                            flag = FLAG.TIED_FAMILY
-                            count = c_count
+            flag, count = Evaluate_Site(f.Get_Best(), name, family_1, family_2,
+                    matches)
+            # Stats
+            if flag == FLAG.SUCCESS:
+                perfect += 1
+                files_perfect[i] += 1
+            if flag == FLAG.SUCCESS or flag == FLAG.FAMILY:
+                partial += 1
+                files_partial[i] += 1
             # Values
-            value=DICT__Values[classification][output_values][tiebreaker][flag]
+            value = scores[flag]
             if output_values == VALUES.COUNT: value = value*count
-            values.append(str(value))
-        # Max stats
-        if perfect > site_max_perfect: site_max_perfect = perfect
-        if partial > site_max_partial: site_max_partial = partial
+            results.append(str(value))
+        sites_perfect.append(perfect)
+        sites_partial.append(partial)
         # Write
-        sb = "\t".join(values) + "\n"
-        o.write(sb)
+        o.write("\t".join(results) + "\n")
     
     # Close up
     b.Close()
     o.close()
     for f in files:
         f.Close()
+    return [path_shard, files_perfect, files_partial, sites_perfect,
+            sites_partial]
+
+def Evaluate_Site(best, name, family_1, family_2, matches):
+    """
+    Evaluate the best call or calls made by a RetroSeq Calls file for a TE
+    site.
     
-    PRINT.printP(STR__compare_complete)
+    Return the flag of the result, and the number of reads supporting the call
+    which the flag is based on. (0 if there is no such call)
     
-    # Reporting
-    Report_Metrics(sites, site_max_perfect, site_max_partial, files_perfect,
-            files_partial)
-    sites = 0
-    site_max_perfect = 0
-    site_max_partial = 0
-    files_perfect = [0]*length
-    files_partial = [0]*length
+    @best
+            (list<[str, int, int, str]>)
+            The call or calls with the highest read count, as returned by
+            RetroSeq_Calls_Reader.Get_Best.
+    @name
+            (str)
+            The original TE element name, in uppercase.
+    @family_1
+            (str)
+            The first of two strings from the original annotations for the TE
+            element denoting its family.
+    @family_2
+            (str)
+            The second of two strings from the original annotations for the TE
+            element denoting its family.
+    @matches
+            (dict<str:int>)
+            The cached results of Match_Call for this TE element, keyed by the
+            called TE. Updated with any new results.
     
-    # Wrap up
-    return 0
-
+    Evaluate_Site(list<[str, int, int, str]>, str, str, str, dict<str:int>) ->
+            [int, int]
+    """
+    calls = len(best)
+    count = 0
+    flag = FLAG.SKIP
+    if calls == 0: pass
+    elif calls == 1:
+        c_chr_, c_start, c_count, c_name = best[0]
+        count = c_count
+        match = matches.get(c_name, None)
+        if match == None:
+            match = Match_Call(c_name, name, family_1, family_2)
+            matches[c_name] = match
+        if match == MATCH.PERFECT:
+            flag = FLAG.SUCCESS
+        elif match == MATCH.PARTIAL:
+            flag = FLAG.FAMILY
+        else:
+            flag = FLAG.FAIL
+    else:
+        for call in best:
+            c_chr_, c_start, c_count, c_name = call
+            match = matches.get(c_name, None)
+            if match == None:
+                match = Match_Call(c_name, name, family_1, family_2)
+                matches[c_name] = match
+            if match == MATCH.PERFECT:
+                flag = FLAG.TIED_SUCCESS
+                count = c_count
+            elif match == MATCH.PARTIAL:
+                if flag != FLAG.TIED_SUCCESS:
+                    flag = FLAG.TIED_FAMILY
+                    count = c_count
+    return [flag, count]
 
+def Match_Call(called, name, family_1, family_2):
+    """
+    Return whether a call made by RetroSeq is a perfect match, a partial match,
+    (See: Partial_Match) or not a match for a TE element.
+    
+    The number of distinct TE names and families is small, so the results are
+    cached in [DICT__match] by the caller, with one dictionary for each
+    combination of TE element name and families, keyed by the called TE. Each
+    combination is therefore only converted to uppercase and scanned for
+    substrings once.
+    
+    @called
+            (str)
+            The TE called by RetroSeq, as it appears in the calls file.
+    @name
+            (str)
+            The original TE element name, in uppercase.
+    @family_1
+            (str)
+            The first of two strings from the original annotations for the TE
+            element denoting its family.
+    @family_2
+            (str)
+            The second of two strings from the original annotations for the TE
+            element denoting its family.
+    
+    Match_Call(str, str, str, str) -> int
+    """
+    called = called.upper()
+    if called == name: return MATCH.PERFECT
+    if Partial_Match(name, family_1, family_2, called): return MATCH.PARTIAL
+    return MATCH.NONE
 
 def Partial_Match(original, family_1, family_2, called):
     """
@@ -1046,12 +1341,15 @@ def Parse_Command_Line_Input__Compare_RetroSeq_Results(raw_command_line_input):
     classification = DEFAULT__Classification
     values = DEFAULT__Values
     tiebreaker = DEFAULT__Tiebreaker
+    backend = DEFAULT__Backend
+    processes = DEFAULT__Processes
+    cache = DEFAULT__Cache
     
     # Initial validation
     while inputs:
         arg = inputs.pop(0)
         try: # Following arguments
-            if arg in ["-o", "-c", "-v", "-t"]:
+            if arg in ["-o", "-c", "-v", "-t", "-b", "-p", "-k"]:
                 arg2 = inputs.pop(0)
             else: # Invalid
                 arg = Strip_X(arg)
@@ -1086,6 +1384,25 @@ def Parse_Command_Line_Input__Compare_RetroSeq_Results(raw_command_line_input):
                 PRINT.printE(STR__invalid_values.format(s = arg))
                 PRINT.printE(STR__use_help)
                 return 1
+        elif arg == "-b":
+            if arg2 in LIST__STREAM: backend = BACKEND.STREAM
+            elif arg2 in LIST__INDEX: backend = BACKEND.INDEX
+            else:
+                PRINT.printE(STR__invalid_backend.format(S = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-p":
+            processes = Validate_Int_NonNeg(arg2)
+            if processes < 1:
+                PRINT.printE(STR__invalid_processes.format(S = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-k":
+            cache = Validate_Bool(arg2)
+            if cache == None:
+                PRINT.printE(STR__invalid_cache.format(S = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
         else: #arg == "-t"
             if arg2 in LIST__FULL: tiebreaker = TIEBREAKER.FULL
             elif arg2 in LIST__PARTIAL: tiebreaker = TIEBREAKER.PARTIAL
@@ -1095,6 +1412,11 @@ def Parse_Command_Line_Input__Compare_RetroSeq_Results(raw_command_line_input):
                 PRINT.printE(STR__use_help)
                 return 1
     
+    if cache and backend != BACKEND.INDEX:
+        PRINT.printE(STR__cache_requires_index)
+        PRINT.printE(STR__use_help)
+        return 1
+    
     # Automated output path generation
     if not path_out: path_out = path_in_folder + FILEMOD
     
@@ -1110,7 +1432,8 @@ def Parse_Command_Line_Input__Compare_RetroSeq_Results(raw_command_line_input):
     
     # Run program
     exit_state = Compare_RetroSeq_Results__STR(path_in_baseline, path_in_folder,
-            path_in_chromosomes, path_out, classification, values, tiebreaker)
+            path_in_chromosomes, path_out, classification, values, tiebreaker,
+            backend, processes, cache)
     
     # Exit
     if exit_state == 0: return 0
@@ -0,0 +1,178 @@
+"""
+FASTA ARCHIVE FILE READER
+(version 1.0)
+by Angelo Chan
+
+This module contains a Class capable of retrieving individual sequences from a
+FASTA archive, as produced by Fasta_To_Eref.py in archive mode.
+
+A FASTA archive is a single multi-FASTA file in which every line of sequence
+has the same width, (except for the last line of each sequence) accompanied by
+an index file. The index file is a 5-column TSV in the same format as the FAI
+files produced by "samtools faidx":
+    1:  Sequence name
+    2:  Sequence length (bp)
+    3:  Byte offset of the first base of the sequence
+    4:  Bases per line
+    5:  Bytes per line (bases plus the newline characters)
+"""
+
+# Imported Modules #############################################################
+
+import os
+
+
+
+# Classes ######################################################################
+
+class FASTA_Archive_Reader:
+    """
+    The FASTA Archive Reader loads the index of a FASTA archive into memory,
+    and can then retrieve any sequence in the archive with a single seek and
+    read, without scanning the rest of the archive.
+
+    Designed for the following use:
+
+    f = FASTA_Archive_Reader("F:/Filepath.fa")
+    f.Open()
+
+    for name in names:
+        seq = f.Get_Seq(name)
+        # Your code
+
+    f.Close()
+    """
+
+    # Minor Configurations #####################################################
+
+    _CONFIG__index_extension = ".fai"
+
+
+
+    # Strings ##################################################################
+
+    _MSG__no_index = "FASTA archive index not found:\n\t{S}"
+    _MSG__faulty_index = "Faulty line in FASTA archive index:\n\t{S}"
+    _MSG__unknown_name = "Sequence not found in FASTA archive:\n\t{S}"
+
+
+
+    # Constructor & Destructor #################################################
+
+    def __init__(self, file_path=""):
+        """
+        Creates a FASTA Archive Reader object.
+        """
+        self.file_path = file_path
+        self.file = None
+        self.index = {}
+        self.names = []
+
+    def __del__(self):
+        """
+        Close the archive, if it is still open.
+        """
+        self.Close()
+
+
+
+    # File I/O Methods #########################################################
+
+    def Open(self, new_path=""):
+        """
+        Load the index of the FASTA archive and open the archive for reading.
+        If a file path is not specified, the stored file path will be used
+        instead.
+
+        Return True if the archive and its index were opened successfully.
+        Return False otherwise.
+        """
+        if new_path: self.file_path = new_path
+        path_index = self.file_path + self._CONFIG__index_extension
+        if not os.path.isfile(path_index):
+            self.printE(self._MSG__no_index.format(S = path_index))
+            return False
+        # Index
+        self.index = {}
+        self.names = []
+        f = open(path_index, "U")
+        for line in f:
+            values = line.rstrip("\n").split("\t")
+            if len(values) < 5:
+                self.printE(self._MSG__faulty_index.format(S = line))
+                continue
+            name = values[0]
+            self.index[name] = [int(s) for s in values[1:5]]
+            self.names.append(name)
+        f.close()
+        # Archive
+        self.file = open(self.file_path, "rb")
+        return True
+
+    def Close(self):
+        """
+        Close the archive.
+        """
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+
+    # Property Methods #########################################################
+
+    def Get_Names(self):
+        """
+        Return a list of the names of all the sequences in the archive, in the
+        order they appear in.
+        """
+        return list(self.names)
+
+    def Has(self, name):
+        """
+        Return whether or not the archive contains a sequence of the given name.
+        """
+        return name in self.index
+
+    def Get_Length(self, name):
+        """
+        Return the length of the sequence of the given name.
+
+        Return -1 if there is no such sequence in the archive.
+        """
+        entry = self.index.get(name, None)
+        if not entry: return -1
+        return entry[0]
+
+
+
+    # File Reading Methods #####################################################
+
+    def Get_Seq(self, name):
+        """
+        Return the sequence of the given name.
+
+        Return None if there is no such sequence in the archive.
+        """
+        entry = self.index.get(name, None)
+        if not entry:
+            self.printE(self._MSG__unknown_name.format(S = name))
+            return None
+        length, offset, line_bases, line_bytes = entry
+        if length == 0: return ""
+        # Number of bytes spanned, including the newlines between lines
+        lines = (length - 1) // line_bases
+        size = length + lines*(line_bytes - line_bases)
+        self.file.seek(offset)
+        raw = self.file.read(size)
+        return raw.replace("\r", "").replace("\n", "")
+
+
+
+    # Printing Methods #########################################################
+
+    def printE(self, string):
+        """
+        Print an error message.
+        """
+        print(string)
@@ -10,12 +10,16 @@ The EREF file is a 2-column TSV containing the names of reads and their
 corresponding file paths. The corresponding folder is a foldering containing
 multiple FASTA files, each of which contains a single sequence.
 
+Alternatively, in archive mode, all sequences are written into a single FASTA
+archive with an accompanying index, in place of the folder. (See: mode)
+
 
 
 USAGE:
     
     python27 Fasta_To_Eref.py <input_FASTA> [-o <output_EREF> <output_folder>]
-            [-p <path_prefix>]
+            [-p <path_prefix>] [-l <layout>] [-m <mode>] [-i <incremental>]
+            [-t <threads>] [-s <streaming>] [-d <deduplication>]
 
 
 
@@ -44,6 +48,8 @@ OPTIONAL:
         
         The name of the output folder generated. Directory paths are accepted.
         By default, this will be the prefix of the filepaths in the EREF file.
+        
+        In archive mode, this is instead the filepath of the FASTA archive.
     
     path_prefix
         
@@ -51,6 +57,100 @@ OPTIONAL:
         
         If supplied, this is will be the prefix of the filepaths in the EREF
         file.
+    
+    layout
+        
+        (DEFAULT: 1 - Flat)
+        
+        How the individual FASTA files are arranged inside the output folder.
+        The options are:
+            1:  Flat - All FASTA files are written directly into the output
+                folder.
+            2:  Hashed - The FASTA files are spread across two levels of 256
+                subfolders each, named after the MD5 hash of the sequence name.
+                Recommended for libraries with many thousands of sequences,
+                where a single folder becomes slow to list and search.
+        
+        The filepaths in the EREF file will include the subfolders, if any.
+    
+    mode
+        
+        (DEFAULT: 1 - Files)
+        
+        The kind of output generated. The options are:
+            1:  Files - Each sequence is written into its own FASTA file.
+            2:  Archive - All sequences are written into a single FASTA archive,
+                in which every line of sequence has the same width. An index
+                file (the filepath of the archive, plus ".fai") is written
+                alongside it, recording the byte offset of each sequence, so
+                that any sequence can be retrieved with a single seek.
+                (See: FASTA_Archive_File_Reader.py)
+                The index is in the same format as the ones produced by
+                "samtools faidx".
+        
+        In archive mode, every row of the EREF file will contain the filepath
+        of the archive, or the path_prefix if one was supplied.
+    
+    incremental
+        
+        (DEFAULT: N)
+        
+        Whether or not to update an output folder generated by a previous run,
+        rather than rewriting it from scratch. (Files mode only)
+        
+        A manifest file, recording the name, MD5 hash and relative filepath of
+        every sequence, is kept in the output folder. FASTA files for sequences
+        which are unchanged since the last run are left alone. FASTA files for
+        sequences which are new or have changed are (re)written. FASTA files for
+        sequences which are no longer in the input file are deleted. The EREF
+        file is regenerated from the manifest.
+    
+    threads
+        
+        (DEFAULT: 1)
+        
+        The number of FASTA files which may be written at the same time. (Files
+        mode only) Useful on network filesystems, where most of the time spent
+        writing each file is spent waiting on the filesystem.
+        
+        The rows of the EREF file will remain in the same order as the input
+        file regardless.
+    
+    streaming
+        
+        (DEFAULT: N)
+        
+        Whether or not to copy the sequences from the input file to the output
+        file(s) in chunks, rewrapping the lines as they are copied, rather than
+        reading each sequence into memory in full. Memory usage will remain
+        constant regardless of the length of the sequences. Recommended for
+        inputs with very long sequences, such as assembled chromosomes.
+        
+        Cannot be used in combination with incremental mode, deduplication, or
+        with more than one thread.
+    
+    deduplication
+        
+        (DEFAULT: 1 - None)
+        
+        How sequences which are identical to an earlier sequence in the input
+        file are handled. The options are:
+            1:  None - Each sequence is written out separately.
+            2:  Hardlink - The FASTA file of each duplicate sequence is created
+                as a hardlink to the FASTA file of the first copy of that
+                sequence. (Files mode only) Note that the FASTA header inside
+                the file will therefore be the name of the first copy.
+                If the filesystem does not support hardlinks, the Shared option
+                is used instead.
+            3:  Shared - No FASTA file is written for duplicate sequences.
+                Their rows in the EREF file contain the filepath of the FASTA
+                file of the first copy of that sequence instead.
+        
+        In archive mode, both the Hardlink and Shared options record duplicate
+        sequences in the index using the location of the first copy, without
+        writing them into the archive again.
+        
+        The number of duplicate sequences will be reported.
 
 
 
@@ -58,11 +158,25 @@ EXAMPLES:
     
     python27 Fasta_To_Eref.py RepbaseConsensuses.fa -o RetroSeq_Eref.tsv
             RetroSeq_Eref_Folder
+    
+    python27 Fasta_To_Eref.py Dfam.fa -o Dfam_Eref.tsv Dfam_Eref_Folder -l 2
+    
+    python27 Fasta_To_Eref.py Dfam.fa -o Dfam_Eref.tsv Dfam_Archive.fa -m 2
+    
+    python27 Fasta_To_Eref.py Dfam.fa -o Dfam_Eref.tsv Dfam_Eref_Folder -i Y
+    
+    python27 Fasta_To_Eref.py Dfam.fa -o Dfam_Eref.tsv Dfam_Eref_Folder -t 16
+    
+    python27 Fasta_To_Eref.py hg38.fa -o hg38_Eref.tsv hg38_Eref_Folder -s Y
+    
+    python27 Fasta_To_Eref.py Combined.fa -o Combined_Eref.tsv Combined_Folder
+            -d 2
 
 USAGE:
     
     python27 Fasta_To_Eref.py <input_FASTA> [-o <output_EREF> <output_folder>]
-            [-p <path_prefix>]
+            [-p <path_prefix>] [-l <layout>] [-m <mode>] [-i <incremental>]
+            [-t <threads>] [-s <streaming>] [-d <deduplication>]
 """
 
 NAME = "Fasta_To_Eref.py"
@@ -82,6 +196,7 @@ PRINT_METRICS = True
 
 FILEMOD__EREF = "__EREF.tsv"
 FILEMOD__FOLD = "__CON_SEQS"
+FILEMOD__ARCHIVE = "__CON_SEQS.fa"
 
 
 
@@ -90,6 +205,27 @@ FILEMOD__FOLD = "__CON_SEQS"
 DEFAULT__width = 80 # Width of the output FASTA files
 
 FILEMOD__FASTA_EXTENSION = ".fa"
+FILEMOD__INDEX_EXTENSION = ".fai"
+FILEMOD__MANIFEST = "__MANIFEST.tsv" # Kept inside the output folder
+
+DEFAULT__queue_factor = 8 # Files queued per thread, when writing in parallel
+
+DEFAULT__chunk_size = 65536 # Max bytes read at a time, in streaming mode
+
+DEFAULT__shard_levels = 2 # Levels of subfolders for the hashed layout
+DEFAULT__shard_chars = 2 # Hex characters per subfolder name (2 = 256 folders)
+
+
+
+# Defaults #####################################################################
+"NOTE: altering these will not alter the values displayed in the HELP DOC"
+
+DEFAULT__layout = 1 # Flat
+DEFAULT__mode = 1 # Files
+DEFAULT__incremental = False
+DEFAULT__threads = 1
+DEFAULT__streaming = False
+DEFAULT__dedup = 1 # None
 
 
 
@@ -98,7 +234,10 @@ FILEMOD__FASTA_EXTENSION = ".fa"
 import sys
 import os
 
+import hashlib
 import random as Random
+import threading
+import Queue
 
 
 
@@ -111,6 +250,200 @@ from Width_File_Writer import *
 
 
 
+# Enums ########################################################################
+
+class LAYOUT:
+    FLAT=1
+    HASHED=2
+
+class MODE:
+    FILES=1
+    ARCHIVE=2
+
+class DEDUP:
+    NONE=1
+    HARDLINK=2
+    SHARED=3
+
+
+
+# Classes ######################################################################
+
+class FASTA_Writer_Pool:
+    """
+    A bounded pool of threads, each with its own Width_File_Writer, which write
+    individual FASTA files in parallel.
+    
+    At most [DEFAULT__queue_factor] files per thread may be waiting to be
+    written at any one time. Submitting more will block until a thread is
+    free, keeping memory usage bounded.
+    
+    Errors do not stop the other threads. They are recorded, and returned by
+    Finish().
+    
+    Designed for the following use:
+    
+    pool = FASTA_Writer_Pool(8)
+    for name, seq, path in sequences:
+        pool.Submit(path, name, seq)
+    errors = pool.Finish()
+    """
+    
+    def __init__(self, threads):
+        """
+        Create the queue and start the threads.
+        """
+        self.queue = Queue.Queue(threads*DEFAULT__queue_factor)
+        self.errors = []
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(threads):
+            thread = threading.Thread(target = self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+    
+    def Submit(self, path, name, seq):
+        """
+        Queue a FASTA file to be written.
+        """
+        self.queue.put([path, name, seq])
+    
+    def Finish(self):
+        """
+        Wait for all queued FASTA files to be written, and stop the threads.
+        
+        Return a list of the filepaths which could not be written, and the
+        corresponding error messages.
+        
+        Finish() -> list<[str, str]>
+        """
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.errors
+    
+    def _work(self):
+        """
+        Write queued FASTA files until told to stop.
+        """
+        w = Create_Width_File_Writer()
+        while True:
+            job = self.queue.get()
+            if job == None: return
+            path, name, seq = job
+            try:
+                Write_FASTA_File(w, path, name, seq)
+            except Exception as error:
+                self.lock.acquire()
+                self.errors.append([path, str(error)])
+                self.lock.release()
+
+class FASTA_Chunk_Reader:
+    """
+    A FASTA file reader which reads the sequences in chunks of at most
+    [chunk_size] bytes, instead of reading an entire sequence into memory at
+    once. Line breaks and surrounding whitespace are removed from the chunks.
+    
+    Designed for the following use:
+    
+    f = FASTA_Chunk_Reader(65536)
+    f.Open("F:/Filepath.fa")
+    while not f.End():
+        f.Read()
+        name = f.Get_Name()
+        chunk = f.Read_Chunk()
+        while chunk:
+            # Your code
+            chunk = f.Read_Chunk()
+    f.Close()
+    """
+    
+    def __init__(self, chunk_size):
+        """
+        Create a FASTA Chunk Reader object.
+        """
+        self.chunk_size = chunk_size
+        self.file = None
+        self.name = ""
+        self.next_name = None
+        self.in_record = False
+        self.line_start = True
+    
+    def Open(self, path):
+        """
+        Open a FASTA file and find the first sequence.
+        """
+        self.file = open(path, "U")
+        self.next_name = None
+        self.in_record = True # Skip anything before the first header
+        self.line_start = True
+        self._skip_record()
+    
+    def Close(self):
+        """
+        Close the FASTA file.
+        """
+        self.file.close()
+    
+    def End(self):
+        """
+        Return whether or not there are no more sequences to be read.
+        """
+        return self.next_name == None
+    
+    def Read(self):
+        """
+        Move onto the next sequence. Any unread chunks of the current sequence
+        are skipped.
+        """
+        self._skip_record()
+        self.name = self.next_name
+        self.next_name = None
+        self.in_record = True
+    
+    def Get_Name(self):
+        """
+        Return the name of the current sequence.
+        """
+        return self.name
+    
+    def Read_Chunk(self):
+        """
+        Return the next chunk of the current sequence.
+        
+        Return an empty string if there is nothing left of the current sequence.
+        """
+        while self.in_record:
+            raw = self.file.readline(self.chunk_size)
+            if not raw: # End of file
+                self.in_record = False
+                return ""
+            line_start = self.line_start
+            self.line_start = raw[-1] == "\n"
+            if line_start and raw[0] == ">": # Start of the next sequence
+                if not self.line_start: raw += self.file.readline()
+                self.next_name = raw[1:].rstrip("\r\n")
+                self.line_start = True
+                self.in_record = False
+                return ""
+            chunk = raw.strip()
+            if chunk: return chunk
+        return ""
+    
+    def _skip_record(self):
+        """
+        Skip the remaining chunks of the current sequence.
+        """
+        while self.Read_Chunk():
+            pass
+
+
+
+
+
+
 # Strings ######################################################################
 
 STR__use_help = "\nUse the -h option for help:\n\t python Fasta_To_Eref.py -h"
@@ -120,12 +453,59 @@ STR__metrics = """
             Total bases: {B}
     Average Read Length: {C}"""
 
+STR__metrics_duplicates = """
+    Duplicate Sequences: {A}"""
+
+STR__metrics_incremental = """
+        Unchanged Files: {A}
+          Written Files: {B}
+          Removed Files: {C}"""
+
 STR__parsing_args = "\nParsing arguments..."
 
 STR__f2e_begin = "\nRunning Fasta_To_Eref..."
 
 STR__f2e_complete = "\nFasta_To_Eref successfully finished."
 
+STR__invalid_layout = """
+ERROR: Invalid folder layout specified:
+    {s}"""
+
+STR__invalid_mode = """
+ERROR: Invalid output mode specified:
+    {s}"""
+
+STR__invalid_threads = """
+ERROR: Invalid number of threads:
+    {s}
+Please specify a positive integer."""
+
+STR__write_error = """
+ERROR: Unable to write FASTA file:
+    {f}
+    ({e})"""
+
+STR__streaming_incompatible = """
+ERROR: Streaming mode cannot be used in combination with incremental mode,
+deduplication, or with more than one thread."""
+
+STR__invalid_dedup = """
+ERROR: Invalid deduplication method specified:
+    {s}"""
+
+STR__no_hardlinks = """
+WARNING: Hardlinks are not supported on this system. Duplicate sequences will
+share the FASTA file of the first copy instead."""
+
+STR__link_error = """
+ERROR: Unable to create hardlink:
+    {f}
+    ({e})"""
+
+STR__subfolder_error = """
+ERROR: Unable to create subfolder:
+    {f}"""
+
 
 
 STR__unexpected_failure = "\nProgram exited with an unexpected error."
@@ -139,6 +519,19 @@ Do you wish to overwrite them in the event of a naming clash? (y/n): """
 
 # Lists ########################################################################
 
+LIST__flat = ["F", "f", "FLAT", "Flat", "flat", "1"]
+LIST__hashed = ["H", "h", "HASHED", "Hashed", "hashed", "HASH", "Hash", "hash",
+        "2"]
+
+LIST__files = ["F", "f", "FILES", "Files", "files", "FILE", "File", "file", "1"]
+LIST__archive = ["A", "a", "ARCHIVE", "Archive", "archive", "2"]
+
+LIST__none = ["N", "n", "NONE", "None", "none", "1"]
+LIST__hardlink = ["H", "h", "HARDLINK", "Hardlink", "hardlink", "LINK", "Link",
+        "link", "2"]
+LIST__shared = ["S", "s", "SHARED", "Shared", "shared", "SHARE", "Share",
+        "share", "3"]
+
 
 
 # Dictionaries #################################################################
@@ -155,7 +548,9 @@ PRINT.PRINT_METRICS = PRINT_METRICS
 
 # Functions ####################################################################
 
-def Fasta_To_Eref(path_in, path_eref, path_folder, path_mod):
+def Fasta_To_Eref(path_in, path_eref, path_folder, path_mod,
+            layout=DEFAULT__layout, incremental=DEFAULT__incremental,
+            threads=DEFAULT__threads, dedup=DEFAULT__dedup):
     """
     Generate an EREF file and corresponding folder from a FASTA file.
     
@@ -178,8 +573,37 @@ def Fasta_To_Eref(path_in, path_eref, path_folder, path_mod):
             The path appended to the filename in the reference column of the
             EREF file.
             Assumed to end in either "/" or "\".
+    @layout
+            (int) - Pseudo ENUM
+            How the individual FASTA files are arranged inside the output
+            folder:
+                1:  Flat - Directly inside the output folder.
+                2:  Hashed - Inside nested subfolders derived from the MD5 hash
+                    of the sequence name. (See: Get_Shard_Subpath)
+    @incremental
+            (bool)
+            Whether or not to update the contents of the output folder, as
+            recorded in its manifest file by a previous run, by only writing
+            the FASTA files of new or changed sequences and deleting the FASTA
+            files of sequences no longer in the input file. The EREF file is
+            regenerated from the updated manifest.
+    @threads
+            (int)
+            The number of threads used to write the FASTA files. If more than 1,
+            the FASTA files are written in parallel by a FASTA_Writer_Pool.
+    @dedup
+            (int) - Pseudo ENUM
+            How sequences identical to an earlier sequence are handled:
+                1:  None - Written out separately.
+                2:  Hardlink - Their FASTA files are hardlinks to the FASTA file
+                    of the first copy.
+                3:  Shared - No FASTA file is written. The EREF file points to
+                    the FASTA file of the first copy.
+    
+    Return a value of 0 if the function runs successfully.
+    Return a value of 1 if there is a problem.
     
-    Fasta_To_Eref(str, str, str, str) -> int
+    Fasta_To_Eref(str, str, str, str, int, bool, int, int) -> int
     """
     # Sanitize paths
     if path_folder[-1] not in ["/", "\\"]:
@@ -190,6 +614,26 @@ def Fasta_To_Eref(path_in, path_eref, path_folder, path_mod):
     # Set up reporting
     reads = 0
     bases = 0
+    unchanged = 0
+    written = 0
+    removed = 0
+    duplicates = 0
+    
+    # Subfolders which are known to exist (Hashed layout)
+    subfolders = {}
+    
+    # Deduplication
+    if dedup == DEDUP.HARDLINK and not hasattr(os, "link"):
+        PRINT.printE(STR__no_hardlinks)
+        dedup = DEDUP.SHARED
+    seen = {} # MD5 hashes of sequences, and the first FASTA file written
+    links = [] # Hardlinks which need to wait for parallel writing to finish
+    
+    # Manifests (Incremental mode)
+    path_manifest = path_folder + FILEMOD__MANIFEST
+    manifest_old = {}
+    manifest_new = []
+    if incremental: manifest_old = Read_Manifest(path_manifest)
     
     # Setup the I/O
     try:
@@ -201,11 +645,10 @@ def Fasta_To_Eref(path_in, path_eref, path_folder, path_mod):
         e = open(path_eref, "w")
     except:
         return 1
-    w = Width_File_Writer()
-    w.Overwrite_Allow()
-    w.Set_Width(DEFAULT__width)
-    w.Set_Newline("\n")
-    w.Toggle_Printing_M(True)
+    w = None
+    pool = None
+    if threads > 1: pool = FASTA_Writer_Pool(threads)
+    else: w = Create_Width_File_Writer()
     
     # Main loop
     PRINT.printP(STR__f2e_begin)
@@ -219,30 +662,530 @@ def Fasta_To_Eref(path_in, path_eref, path_folder, path_mod):
         # Metrics
         reads += 1
         bases += len(seq)
+        # Layout
+        if layout == LAYOUT.HASHED:
+            subpath = Get_Shard_Subpath(name)
+            if not Create_Subfolder(path_folder, subpath, subfolders):
+                if pool: pool.Finish()
+                e.close()
+                f.Close()
+                return 1
+            name_ = subpath + name_
+        # Deduplication
+        if incremental or dedup != DEDUP.NONE:
+            digest = hashlib.md5(seq).hexdigest()
+        shared = False
+        link = ""
+        if dedup != DEDUP.NONE:
+            first = seen.get(digest, None)
+            if first == None:
+                seen[digest] = name_
+            else:
+                duplicates += 1
+                if dedup == DEDUP.SHARED:
+                    shared = True
+                    name_ = first
+                else:
+                    link = path_folder + first
         # Paths
         path1 = path_mod + name_ # String which is written to file
         path2 = path_folder + name_ # Actual path of the FASTA output file
+        # Eref (Regenerated from the manifest at the end, in incremental mode)
+        if incremental:
+            manifest_new.append([name, digest, name_])
+            if shared: continue
+            if ((manifest_old.get(name, None) == [digest, name_]) and
+                    os.path.isfile(path2)):
+                unchanged += 1
+                continue
+            written += 1
+        else:
+            e.write(name + "\t" + path1 + "\n")
+        # File
+        if shared: pass
+        elif link:
+            if pool: links.append([link, path2])
+            else:
+                error = Link_FASTA_File(link, path2)
+                if error:
+                    PRINT.printE(STR__link_error.format(f = path2, e = error))
+                    e.close()
+                    f.Close()
+                    return 1
+        elif pool: pool.Submit(path2, name, seq)
+        else: Write_FASTA_File(w, path2, name, seq)
+    
+    # Wait for parallel writing to finish
+    if pool:
+        errors = pool.Finish()
+        if errors:
+            for path2, error in errors:
+                PRINT.printE(STR__write_error.format(f = path2, e = error))
+            e.close()
+            f.Close()
+            return 1
+        for link, path2 in links:
+            error = Link_FASTA_File(link, path2)
+            if error:
+                PRINT.printE(STR__link_error.format(f = path2, e = error))
+                e.close()
+                f.Close()
+                return 1
+    
+    # Update manifest, remove outdated files, and regenerate EREF
+    if incremental:
+        current = {}
+        for name, digest, name_ in manifest_new:
+            current[name_] = True
+            e.write(name + "\t" + path_mod + name_ + "\n")
+        for name in manifest_old:
+            name_ = manifest_old[name][1]
+            if name_ in current: continue
+            path2 = path_folder + name_
+            if os.path.isfile(path2): os.remove(path2)
+            removed += 1
+        Write_Manifest(path_manifest, manifest_new)
+    PRINT.printP(STR__f2e_complete)
+    
+    # Close up
+    e.close()
+    f.Close()
+    
+    # Reporting
+    incremental_metrics = []
+    if incremental: incremental_metrics = [unchanged, written, removed]
+    if dedup == DEDUP.NONE: duplicates = None
+    Report_Metrics(reads, bases, incremental_metrics, duplicates)
+
+    # Wrap up
+    return 0
+
+def Create_Width_File_Writer():
+    """
+    Return a Width_File_Writer configured for writing the individual FASTA
+    files.
+    
+    Create_Width_File_Writer() -> Width_File_Writer
+    """
+    w = Width_File_Writer()
+    w.Overwrite_Allow()
+    w.Set_Width(DEFAULT__width)
+    w.Set_Newline("\n")
+    w.Toggle_Printing_M(True)
+    return w
+
+def Write_FASTA_File(w, path, name, seq):
+    """
+    Write a single sequence into its own FASTA file, replacing any existing
+    file. The existing file is removed rather than overwritten, as it may be a
+    hardlink shared with the FASTA files of other sequences.
+    
+    @w
+            (Width_File_Writer)
+            The file writer used to write the FASTA file.
+    @path
+            (str - filepath)
+            The filepath of the FASTA file.
+    @name
+            (str)
+            The name of the sequence.
+    @seq
+            (str)
+            The sequence.
+    
+    Write_FASTA_File(Width_File_Writer, str, str, str) -> None
+    """
+    if os.path.lexists(path): os.remove(path)
+    w.Open(path)
+    w.Write_F(">" + name)
+    w.Newline()
+    w.Write(seq)
+    w.Close()
+
+def Link_FASTA_File(path_first, path):
+    """
+    Create the FASTA file of a duplicate sequence as a hardlink to the FASTA
+    file of the first copy of that sequence, replacing any existing file.
+    
+    Return an empty string if successful, or the error message otherwise.
+    
+    @path_first
+            (str - filepath)
+            The filepath of the FASTA file of the first copy.
+    @path
+            (str - filepath)
+            The filepath of the FASTA file of the duplicate.
+    
+    Link_FASTA_File(str, str) -> str
+    """
+    try:
+        if os.path.lexists(path): os.remove(path)
+        os.link(path_first, path)
+    except Exception as error:
+        return str(error)
+    return ""
+
+def Fasta_To_Eref__ARCHIVE(path_in, path_eref, path_archive, path_mod,
+            dedup=DEFAULT__dedup):
+    """
+    Generate an EREF file and corresponding FASTA archive from a FASTA file.
+    
+    The FASTA archive is a single multi-FASTA file in which every line of
+    sequence is [DEFAULT__width] bases wide, except for the last line of each
+    sequence. An index file, which records the length and byte offset of each
+    sequence in the same format as "samtools faidx", is written alongside it.
+    
+    @path_in
+            (str - filepath)
+            The filepath of the input FASTA file.
+    @path_eref
+            (str - filepath)
+            The filepath of the output EREF file.
+            Every row will contain the name of a sequence, and [path_mod].
+    @path_archive
+            (str - filepath)
+            The filepath of the output FASTA archive. The filepath of the index
+            file will be this, plus [FILEMOD__INDEX_EXTENSION].
+    @path_mod
+            (str - filepath)
+            The path written in the reference column of the EREF file.
+    @dedup
+            (int) - Pseudo ENUM
+            How sequences identical to an earlier sequence are handled:
+                1:  None - Written into the archive separately.
+                2/3:  Hardlink/Shared - Not written into the archive again. The
+                    index records them at the location of the first copy.
+    
+    Fasta_To_Eref__ARCHIVE(str, str, str, str, int) -> int
+    """
+    # Set up reporting
+    reads = 0
+    bases = 0
+    duplicates = 0
+    
+    # Deduplication
+    seen = {} # MD5 hashes of sequences, and the byte offset of the first copy
+    
+    # Setup the I/O
+    try:
+        f = FASTA_Reader()
+        f.Open(path_in)
+    except:
+        return 1
+    try:
+        e = open(path_eref, "w")
+        o = open(path_archive, "wb") # Binary, for accurate byte offsets
+        i = open(path_archive + FILEMOD__INDEX_EXTENSION, "w")
+    except:
+        return 1
+    
+    # Main loop
+    PRINT.printP(STR__f2e_begin)
+    while not f.End():
+        f.Read()
+        name = f.Get_Name()
+        name = name.split("\t")
+        name = name[0]
+        seq = f.Get_Seq()
+        length = len(seq)
+        # Metrics
+        reads += 1
+        bases += length
+        # Eref
+        e.write(name + "\t" + path_mod + "\n")
+        # Deduplication
+        offset = -1
+        if dedup != DEDUP.NONE:
+            digest = hashlib.md5(seq).hexdigest()
+            offset = seen.get(digest, -1)
+            if offset != -1: duplicates += 1
+        # Archive
+        if offset == -1:
+            o.write(">" + name + "\n")
+            offset = o.tell()
+            lines = []
+            for start in range(0, length, DEFAULT__width):
+                lines.append(seq[start:start+DEFAULT__width])
+            if lines: o.write("\n".join(lines) + "\n")
+            if dedup != DEDUP.NONE: seen[digest] = offset
+        # Index
+        values = [name, str(length), str(offset), str(DEFAULT__width),
+                str(DEFAULT__width + 1)]
+        i.write("\t".join(values) + "\n")
+    PRINT.printP(STR__f2e_complete)
+    
+    # Close up
+    i.close()
+    o.close()
+    e.close()
+    f.Close()
+    
+    # Reporting
+    if dedup == DEDUP.NONE: duplicates = None
+    Report_Metrics(reads, bases, [], duplicates)
+
+    # Wrap up
+    return 0
+
+def Fasta_To_Eref__STREAM(path_in, path_eref, path_out, path_mod, layout,
+            mode):
+    """
+    Generate an EREF file and corresponding folder or FASTA archive from a
+    FASTA file, copying the sequences in chunks rather than reading each
+    sequence into memory in full. The lines of sequence are rewrapped to
+    [DEFAULT__width] as they are copied.
+    
+    Memory usage remains constant regardless of the length of the sequences.
+    
+    @path_in
+            (str - filepath)
+            The filepath of the input FASTA file.
+    @path_eref
+            (str - filepath)
+            The filepath of the output EREF file.
+    @path_out
+            (str - dirpath/filepath)
+            The filepath of the output folder in files mode, or the filepath of
+            the output FASTA archive in archive mode.
+    @path_mod
+            (str - dirpath/filepath)
+            The path appended to the filename in the reference column of the
+            EREF file in files mode, or the path written in the reference
+            column in archive mode.
+    @layout
+            (int) - Pseudo ENUM
+            How the individual FASTA files are arranged inside the output
+            folder. (Files mode only) (See: Fasta_To_Eref)
+    @mode
+            (int) - Pseudo ENUM
+            The kind of output generated:
+                1:  Files - (See: Fasta_To_Eref)
+                2:  Archive - (See: Fasta_To_Eref__ARCHIVE)
+    
+    Return a value of 0 if the function runs successfully.
+    Return a value of 1 if there is a problem.
+    
+    Fasta_To_Eref__STREAM(str, str, str, str, int, int) -> int
+    """
+    archive = (mode == MODE.ARCHIVE)
+    
+    # Sanitize paths
+    if not archive:
+        if path_out[-1] not in ["/", "\\"]:
+            path_out += "/"
+        if path_mod[-1] not in ["/", "\\"]:
+            path_mod += "/"
+    
+    # Set up reporting
+    reads = 0
+    bases = 0
+    
+    # Subfolders which are known to exist (Hashed layout)
+    subfolders = {}
+    
+    # Setup the I/O
+    try:
+        f = FASTA_Chunk_Reader(DEFAULT__chunk_size)
+        f.Open(path_in)
+    except:
+        return 1
+    try:
+        e = open(path_eref, "w")
+        if archive:
+            o = open(path_out, "wb") # Binary, for accurate byte offsets
+            i = open(path_out + FILEMOD__INDEX_EXTENSION, "w")
+    except:
+        return 1
+    
+    # Main loop
+    PRINT.printP(STR__f2e_begin)
+    while not f.End():
+        f.Read()
+        name = f.Get_Name()
+        name = name.split("\t")
+        name = name[0]
+        # Output
+        if archive:
+            path1 = path_mod
+        else:
+            name_ = name + FILEMOD__FASTA_EXTENSION
+            if layout == LAYOUT.HASHED:
+                subpath = Get_Shard_Subpath(name)
+                if not Create_Subfolder(path_out, subpath, subfolders):
+                    e.close()
+                    f.Close()
+                    return 1
+                name_ = subpath + name_
+            path1 = path_mod + name_ # String which is written to file
+            path2 = path_out + name_ # Actual path of the FASTA output file
+            if os.path.lexists(path2): os.remove(path2) # May be a hardlink
+            o = open(path2, "w")
         # Eref
         e.write(name + "\t" + path1 + "\n")
-        # File
-        w.Open(path2)
-        w.Write_F(">" + name)
-        w.Newline()
-        w.Write(seq)
-        w.Close()
+        # Sequence
+        o.write(">" + name + "\n")
+        offset = o.tell()
+        length = 0
+        carry = ""
+        chunk = f.Read_Chunk()
+        while chunk:
+            length += len(chunk)
+            carry = Write_Wrapped(o, carry + chunk)
+            chunk = f.Read_Chunk()
+        if carry: o.write(carry + "\n")
+        # Metrics
+        reads += 1
+        bases += length
+        # Index or close
+        if archive:
+            values = [name, str(length), str(offset), str(DEFAULT__width),
+                    str(DEFAULT__width + 1)]
+            i.write("\t".join(values) + "\n")
+        else:
+            o.close()
     PRINT.printP(STR__f2e_complete)
     
     # Close up
+    if archive:
+        i.close()
+        o.close()
     e.close()
     f.Close()
     
     # Reporting
     Report_Metrics(reads, bases)
-
+    
     # Wrap up
     return 0
 
-def Report_Metrics(reads, bases):
+def Write_Wrapped(o, seq):
+    """
+    Write as many full lines of [DEFAULT__width] bases as possible from [seq]
+    into an open file, and return the remaining bases, which do not make up a
+    full line.
+    
+    @o
+            (file)
+            The open output file.
+    @seq
+            (str)
+            The sequence to be written.
+    
+    Write_Wrapped(file, str) -> str
+    """
+    length = len(seq)
+    full = length - (length % DEFAULT__width)
+    if full:
+        lines = []
+        for start in range(0, full, DEFAULT__width):
+            lines.append(seq[start:start+DEFAULT__width])
+        o.write("\n".join(lines) + "\n")
+    return seq[full:]
+
+def Create_Subfolder(path_folder, subpath, subfolders):
+    """
+    Create the nested subfolders of the hashed layout, if they do not already
+    exist. Subfolders which are known to exist are recorded in [subfolders], so
+    that the filesystem is only checked once for each subfolder.
+    
+    Return True if the subfolders exist or were created.
+    Return False if they could not be created.
+    
+    @path_folder
+            (str - dirpath)
+            The output folder. Assumed to end in either "/" or "\".
+    @subpath
+            (str - dirpath)
+            The relative path of the subfolders. (See: Get_Shard_Subpath)
+    @subfolders
+            (dict<str:bool>)
+            The relative paths of the subfolders known to exist.
+    
+    Create_Subfolder(str, str, dict<str:bool>) -> bool
+    """
+    if subpath in subfolders: return True
+    folder = path_folder + subpath
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except:
+            PRINT.printE(STR__subfolder_error.format(f = folder))
+            return False
+    subfolders[subpath] = True
+    return True
+
+def Read_Manifest(path_manifest):
+    """
+    Read a manifest file, as written by a previous incremental run, and return
+    its contents as a dictionary, with the sequence names as keys and a list
+    containing the MD5 hash of the sequence and the relative filepath of its
+    FASTA file as values.
+    
+    Return an empty dictionary if the manifest file does not exist.
+    
+    @path_manifest
+            (str - filepath)
+            The filepath of the manifest file. A 3-column TSV containing the
+            sequence name, the MD5 hash of the sequence, and the filepath of
+            the FASTA file relative to the output folder.
+    
+    Read_Manifest(str) -> dict<str:[str, str]>
+    """
+    result = {}
+    if not os.path.isfile(path_manifest): return result
+    f = open(path_manifest, "U")
+    for line in f:
+        values = line.rstrip("\n").split("\t")
+        if len(values) < 3: continue
+        result[values[0]] = values[1:3]
+    f.close()
+    return result
+
+def Write_Manifest(path_manifest, manifest):
+    """
+    Write a manifest file for use by future incremental runs.
+    
+    @path_manifest
+            (str - filepath)
+            The filepath of the manifest file.
+    @manifest
+            (list<[str, str, str]>)
+            The sequence name, MD5 hash of the sequence, and relative filepath
+            of the FASTA file, for every sequence, in the order they appear in.
+    
+    Write_Manifest(str, list<[str, str, str]>) -> None
+    """
+    o = open(path_manifest, "w")
+    for values in manifest:
+        o.write("\t".join(values) + "\n")
+    o.close()
+
+def Get_Shard_Subpath(name):
+    """
+    Return the relative path of the nested subfolders which the FASTA file of a
+    sequence is written into under the hashed layout.
+    
+    The subfolders are named after successive segments of the MD5 hash of the
+    sequence name. There are [DEFAULT__shard_levels] levels of subfolders, each
+    named using [DEFAULT__shard_chars] hexadecimal characters.
+    
+    Ex.
+        "L1HS" -> "b5/db/"
+    
+    @name
+            (str)
+            The name of the sequence.
+    
+    Get_Shard_Subpath(str) -> str
+    """
+    digest = hashlib.md5(name).hexdigest()
+    sb = ""
+    for i in range(DEFAULT__shard_levels):
+        index = i*DEFAULT__shard_chars
+        sb += digest[index:index+DEFAULT__shard_chars] + "/"
+    return sb
+
+def Report_Metrics(reads, bases, incremental_metrics=[], duplicates=None):
     """
     Print a report into the command line interface of the results of running
     this program.
@@ -253,8 +1196,18 @@ def Report_Metrics(reads, bases):
     @bases)
             (int)
             The total number of bases in the reads processed.
+    @incremental_metrics
+            (list<int>)
+            (Incremental mode only)
+            The number of FASTA files which were left unchanged, written, and
+            removed, respectively.
+    @duplicates
+            (int)
+            (Deduplication only)
+            The number of sequences which were duplicates of an earlier
+            sequence.
     
-    Report_Metrics(int,int) -> None
+    Report_Metrics(int, int, list<int>, int) -> None
     """
     # Calculations
     avg = float(bases)/reads
@@ -270,6 +1223,15 @@ def Report_Metrics(reads, bases):
     str_avg = Pad_Str(str_avg, max_size, " ", 0) 
     # Print
     PRINT.printM(STR__metrics.format(A = str_reads, B = str_bases, C = str_avg))
+    # Incremental
+    if incremental_metrics:
+        strs = [str(i) + "   " for i in incremental_metrics]
+        strs = Pad_Column(strs, 0, 0, " ", 0)
+        PRINT.printM(STR__metrics_incremental.format(A = strs[0], B = strs[1],
+                C = strs[2]))
+    # Deduplication
+    if duplicates != None:
+        PRINT.printM(STR__metrics_duplicates.format(A = str(duplicates)))
 
 
 
@@ -313,13 +1275,19 @@ def Parse_Command_Line_Input__F2E(raw_command_line_input):
     path_eref = ""
     path_folder = ""
     path_mod = ""
+    layout = DEFAULT__layout
+    mode = DEFAULT__mode
+    incremental = DEFAULT__incremental
+    threads = DEFAULT__threads
+    streaming = DEFAULT__streaming
+    dedup = DEFAULT__dedup
     
     # Parse arguments
     while inputs:
         arg = inputs.pop(0)
         
         # Confirm valid flag
-        if arg in ["-p"]: # Second argument
+        if arg in ["-p", "-l", "-m", "-i", "-t", "-s", "-d"]: # Second argument
             try:
                 arg2 = inputs.pop(0)
             except:
@@ -346,13 +1314,63 @@ def Parse_Command_Line_Input__F2E(raw_command_line_input):
             path_folder = arg3
         elif arg == "-p":
             path_mod = arg2
+        elif arg == "-l":
+            if arg2 in LIST__flat: layout = LAYOUT.FLAT
+            elif arg2 in LIST__hashed: layout = LAYOUT.HASHED
+            else:
+                PRINT.printE(STR__invalid_layout.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-m":
+            if arg2 in LIST__files: mode = MODE.FILES
+            elif arg2 in LIST__archive: mode = MODE.ARCHIVE
+            else:
+                PRINT.printE(STR__invalid_mode.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-i":
+            incremental = Validate_Bool(arg2)
+            if incremental == None:
+                PRINT.printE(STR__invalid_bool.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-t":
+            threads = Validate_Int_NonNeg(arg2)
+            if threads < 1:
+                PRINT.printE(STR__invalid_threads.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-s":
+            streaming = Validate_Bool(arg2)
+            if streaming == None:
+                PRINT.printE(STR__invalid_bool.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-d":
+            if arg2 in LIST__none: dedup = DEDUP.NONE
+            elif arg2 in LIST__hardlink: dedup = DEDUP.HARDLINK
+            elif arg2 in LIST__shared: dedup = DEDUP.SHARED
+            else:
+                PRINT.printE(STR__invalid_dedup.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+    
+    # Incompatible options
+    if streaming and (incremental or threads > 1 or dedup != DEDUP.NONE):
+        PRINT.printE(STR__streaming_incompatible)
+        PRINT.printE(STR__use_help)
+        return 1
     
     # Defaults
     if not path_eref:
         path_eref = Generate_Default_Output_File_Path_From_File(path_in,
                 FILEMOD__EREF, False)
-        path_folder = Generate_Default_Output_File_Path_From_File(path_in,
-                FILEMOD__FOLD , False)
+        if mode == MODE.ARCHIVE:
+            path_folder = Generate_Default_Output_File_Path_From_File(path_in,
+                    FILEMOD__ARCHIVE, False)
+        else:
+            path_folder = Generate_Default_Output_File_Path_From_File(path_in,
+                    FILEMOD__FOLD , False)
     if not path_mod:
         path_mod = path_folder
     
@@ -366,21 +1384,43 @@ def Parse_Command_Line_Input__F2E(raw_command_line_input):
     elif valid_eref == 4:
         PRINT.printE(STR__IO_error_write_unable)
         return 1
-    valid_folder = Validate_Write_Path__FOLDER(path_folder)
-    if valid_folder == 0: pass
-    elif valid_folder == 1:
-        PRINT.printM(STR__overwrite_accept)
+    if mode == MODE.ARCHIVE:
+        valid_archive = Validate_Write_Path(path_folder)
+        if valid_archive == 1: PRINT.printM(STR__overwrite_accept)
+        elif valid_archive == 2: return 0
+        elif valid_archive == 3:
+            PRINT.printE(STR__IO_error_write_forbid)
+            return 1
+        elif valid_archive == 4:
+            PRINT.printE(STR__IO_error_write_unable)
+            return 1
     else:
-        if valid_folder == 2: PRINT.printE(STR__IO_error_write_folder_cannot)
-        if valid_folder == 3: PRINT.printE(STR__overwrite_decline)
-        if valid_folder == 4: PRINT.printE(STR__IO_error_write_folder_forbid)
-        if valid_folder == 5:
-            PRINT.printE(STR__IO_error_write_folder_nonexistent)
-        if valid_folder == 6: PRINT.printE(STR__IO_error_write_unexpected)
-        return 1
+        valid_folder = Validate_Write_Path__FOLDER(path_folder)
+        if valid_folder == 0: pass
+        elif valid_folder == 1:
+            PRINT.printM(STR__overwrite_accept)
+        else:
+            if valid_folder == 2:
+                PRINT.printE(STR__IO_error_write_folder_cannot)
+            if valid_folder == 3: PRINT.printE(STR__overwrite_decline)
+            if valid_folder == 4:
+                PRINT.printE(STR__IO_error_write_folder_forbid)
+            if valid_folder == 5:
+                PRINT.printE(STR__IO_error_write_folder_nonexistent)
+            if valid_folder == 6:
+                PRINT.printE(STR__IO_error_write_unexpected)
+            return 1
     
     # Run program
-    Fasta_To_Eref(path_in, path_eref, path_folder, path_mod)
+    if streaming:
+        Fasta_To_Eref__STREAM(path_in, path_eref, path_folder, path_mod, layout,
+                mode)
+    elif mode == MODE.ARCHIVE:
+        Fasta_To_Eref__ARCHIVE(path_in, path_eref, path_folder, path_mod,
+                dedup)
+    else:
+        Fasta_To_Eref(path_in, path_eref, path_folder, path_mod, layout,
+                incremental, threads, dedup)
     
     # Safe exit
     return 0
@@ -20,7 +20,9 @@ of the coding sequence of the gene.
 USAGE:
     
     python27 GTF_to_BED.py <input_file> <field> [-o <output_file>] [-h
-            <header_in> <header_out>] [-n <no_ID_file>]
+            <header_in> <header_out>] [-n <no_ID_file>] [-e <engine>]
+            [-g <grouping>] [-x <field> <level> <output_file>]...
+            [-p <processes>] [-c <cache_file>] [-f <format>]
 
 
 
@@ -104,6 +106,90 @@ OPTIONAL:
         The filepath of the output file for the entries which don't have a valid
         ID.
         If no filepath is specified, this data will be ignored.
+    
+    engine
+        
+        (DEFAULT: 1 - Standard)
+        
+        The method used to read the GTF file. The options are:
+            1:  Standard - The GTF Reader from the File_Reader module, which
+                parses every tag of every row.
+            2:  Fast - The GTF Tag Reader, (GTF_Tag_File_Reader.py) which only
+                extracts the tag specified by [field] using a targeted scan,
+                and does not parse rows for features other than start and stop
+                codons any further. Much faster on GTF files with many tags per
+                row, such as GENCODE annotations.
+        If multiple [processes] are used, the Fast engine is always used, and
+        the Standard engine cannot be specified.
+    
+    grouping
+        
+        (DEFAULT: 1 - Consecutive)
+        
+        How the rows of the GTF file are grouped by their ID. The options are:
+            1:  Consecutive - Rows are grouped with the rows immediately before
+                and after them which share the same ID. All the rows for an ID
+                must therefore be next to each other in the GTF file.
+            2:  Hash - The coordinates of every ID are accumulated in a hash
+                table, so the rows for an ID can be anywhere in the GTF file.
+                The table is spilled to disk if it grows too large. The output
+                is written in sorted genomic order. The [engine] is not used.
+                All rows without a valid ID are written to [no_ID_file].
+    
+    -x
+        
+        Specify an additional output, using the [field] specified as the
+        name/ID, at the feature [level] specified, to be written to the
+        [output_file] specified. This option can be used multiple times.
+        
+        When additional outputs are specified, all outputs are written in a
+        single pass of the GTF file, using the targeted tag scan of the Fast
+        [engine]. Hash [grouping] is not supported. [no_ID_file] applies to the
+        first output only. The feature levels are:
+            1:  Coding - The span of the start and stop codons.
+            2:  Transcript - The span of all the rows for that ID.
+            3:  Exon - Every exon, as a separate BED row.
+    
+    processes
+        
+        (DEFAULT: 1)
+        
+        The number of processes used to parse the GTF file. If more than one
+        process is used, the GTF file is split into chunks at group boundaries,
+        (where the value of [field] changes) which are parsed in parallel using
+        the Fast [engine], and the results are combined in their original
+        order. Chunks are only split at group boundaries, so the rows for an
+        ID must be consecutive, and a single group is never split across
+        processes. Cannot be used with hash [grouping], additional outputs, or
+        the Standard [engine].
+    
+    cache_file
+        
+        (DEFAULT: None)
+        
+        The filepath of a binary annotation cache to be written alongside the
+        output file, containing the same records. The cache contains a hash
+        index of the names and the records sorted by their genomic coordinates,
+        and can be memory-mapped and queried by name or by overlapping
+        coordinates, without parsing the GTF file or BED file again.
+        (See: Annotation_Cache_File_Reader.py)
+        Coordinates in the cache are always 1-based, so the starts of BED12
+        records are converted back from 0-based coordinates.
+        If no filepath is specified, no cache will be written.
+    
+    format
+        
+        (DEFAULT: 1 - BED5)
+        
+        The format of the output file. The options are:
+            1:  BED5 - As described above.
+            2:  BED12 - A transcript model for each coding sequence, in the
+                standard 12-column BED format, with 0-based coordinates. The
+                blocks are the exons, (or the CDS rows, if there are no exons)
+                with overlapping exons merged, and the thick region spans the
+                start and stop codons.
+        The BED12 format cannot be used with hash [grouping] or additional
+        outputs.
 
 
 
@@ -112,13 +198,33 @@ EXAMPLE:
     python27 GTF_to_BED.py path/organism.gtf
     
     python27 GTF_to_BED.py path/organism.gtf -o path/coding_regions.bed -h N Y
+    
+    python27 GTF_to_BED.py path/gencode.gtf gene_id -o path/coding_regions.bed
+            -e 2
+    
+    python27 GTF_to_BED.py path/merged.gtf gene_id -o path/coding_regions.bed
+            -g 2
+    
+    python27 GTF_to_BED.py path/gencode.gtf gene_id -o path/genes.bed -x
+            gene_name T path/gene_spans.bed -x transcript_id E path/exons.bed
+    
+    python27 GTF_to_BED.py path/gencode.gtf gene_id -o path/coding_regions.bed
+            -p 8
+    
+    python27 GTF_to_BED.py path/gencode.gtf gene_name -o path/genes.bed -c
+            path/genes.gtfc
+    
+    python27 GTF_to_BED.py path/gencode.gtf transcript_id -o
+            path/transcripts.bed12 -f BED12
 
 
 
 USAGE:
     
     python27 GTF_to_BED.py <input_file> <field> [-o <output_file>] [-h
-            <header_in> <header_out>] [-n <no_ID_file>]
+            <header_in> <header_out>] [-n <no_ID_file>] [-e <engine>]
+            [-g <grouping>] [-x <field> <level> <output_file>]...
+            [-p <processes>] [-c <cache_file>] [-f <format>]
 """
 
 NAME = "GTF_to_BED.py"
@@ -142,6 +248,12 @@ PRINT_METRICS = True
 
 FILEMOD = "__Coding_Regions.tsv"
 
+FILEMOD__SPILL = ".spill"
+
+DEFAULT__spill_threshold = 500000 # Max IDs held in memory, in hash grouping
+
+DEFAULT__chunks_per_process = 4 # GTF chunks per process, in parallel parsing
+
 
 
 # Defaults #####################################################################
@@ -149,6 +261,10 @@ FILEMOD = "__Coding_Regions.tsv"
 
 DEFAULT__headers_in = False
 DEFAULT__headers_out = False
+DEFAULT__engine = 1 # Standard
+DEFAULT__grouping = 1 # Consecutive
+DEFAULT__processes = 1
+DEFAULT__format = 1 # BED5
 
 
 
@@ -157,6 +273,11 @@ DEFAULT__headers_out = False
 
 import sys
 import os
+import heapq
+import marshal
+import tempfile
+import multiprocessing
+import cStringIO
 
 
 
@@ -164,6 +285,158 @@ import _Controlled_Print as PRINT
 from _Command_Line_Parser import *
 
 from GTF_File_Reader import *
+from GTF_Tag_File_Reader import *
+from Annotation_Cache_File_Reader import *
+
+
+
+# Enums ########################################################################
+
+class ENGINE:
+    STANDARD=1
+    FAST=2
+
+class GROUPING:
+    CONSECUTIVE=1
+    HASH=2
+
+class FORMAT:
+    BED5=1
+    BED12=2
+
+class LEVEL:
+    CODING=1
+    TRANSCRIPT=2
+    EXON=3
+
+
+
+# Classes ######################################################################
+
+class BED_Output:
+    """
+    A single BED output of a multi-output conversion. Groups consecutive rows
+    which share the same value for its field, and writes the coordinates of
+    each group at the specified feature level:
+        
+        CODING      - The span of the start and stop codons.
+        TRANSCRIPT  - The span of all the rows.
+        EXON        - Every exon, as a separate BED row.
+    
+    Each output keeps its own metrics, in the same format as Report_Metrics.
+    
+    Designed for the following use:
+    
+    outputs = [BED_Output("gene_id", LEVEL.CODING, "F:/Genes.bed")]
+    for line, feature, values in rows:
+        for output in outputs:
+            output.Add(line, feature, values)
+    for output in outputs:
+        output.Close()
+    """
+    
+    def __init__(self, field, level, path_out, path_no_ID=""):
+        """
+        Open the output file(s).
+        """
+        self.field = field
+        self.level = level
+        self.features = DICT__level_features[level]
+        self.path_out = path_out
+        self.file = open(path_out, "w")
+        self.no_ID = None
+        if path_no_ID: self.no_ID = open(path_no_ID, "w")
+        # Current group
+        self.ID = None
+        self.coords = []
+        self.rows = []
+        # Metrics
+        self.total_entries = 0
+        self.total_coding = 0
+        self.total_span = 0
+        self.total_NC = 0
+        self.total_no_ID = 0
+    
+    def Add(self, line, feature, values):
+        """
+        Add a row of the GTF file to the output.
+        
+        @line
+                (str)
+                The raw row of the GTF file.
+        @feature
+                (str)
+                The feature type of the row. (3rd column)
+        @values
+                (list<str>)
+                The row, split into its columns. Only required for rows whose
+                feature type is used by this output's level.
+        """
+        ID = Get_Tag_Value(line, self.field)
+        if ID != self.ID:
+            self._flush()
+            self.ID = ID
+        if self.no_ID and not ID: self.rows.append(line)
+        if self.features and feature not in self.features: return
+        s = int(values[3])
+        e = int(values[4])
+        if self.level == LEVEL.EXON:
+            if not self.coords: self.coords = [values[0], s, e, values[6], 0]
+            self.coords[4] += e - s + 1
+            if ID:
+                sb = (values[0] + "\t" + values[3] + "\t" + values[4] + "\t" +
+                        ID + "\t" + values[6] + "\n")
+                self.file.write(sb)
+        elif self.coords:
+            if s < self.coords[1]: self.coords[1] = s
+            if e > self.coords[2]: self.coords[2] = e
+        else:
+            self.coords = [values[0], s, e, values[6]]
+    
+    def Close(self):
+        """
+        Write the last group and close the output file(s).
+        """
+        self._flush()
+        self.file.close()
+        if self.no_ID: self.no_ID.close()
+    
+    def Get_Metrics(self):
+        """
+        Return the metrics of this output, in the format used by
+        Report_Metrics.
+        
+        Get_Metrics() -> [int, int, int, int, int]
+        """
+        return [self.total_entries, self.total_coding, self.total_span,
+                self.total_NC, self.total_no_ID]
+    
+    def _flush(self):
+        """
+        Write the current group, if there is one, and update the metrics.
+        """
+        if self.ID == None: return
+        self.total_entries += 1
+        coords = self.coords
+        if not coords: # Non-coding
+            self.total_NC += 1
+        elif not self.ID: # No ID
+            self.total_no_ID += 1
+            for line in self.rows:
+                values = line.rstrip("\r\n").split("\t")
+                self.no_ID.write("\t".join(values[:9]) + "\n")
+        elif self.level == LEVEL.EXON:
+            self.total_coding += 1
+            self.total_span += coords[4]
+        else:
+            chr_, start, end, strand = coords
+            self.total_coding += 1
+            self.total_span += end - start + 1
+            sb = (chr_ + "\t" + str(start) + "\t" + str(end) + "\t" + self.ID +
+                    "\t" + strand + "\n")
+            self.file.write(sb)
+        self.coords = []
+        self.rows = []
 
 
 
@@ -195,12 +468,93 @@ STR__convert_complete = "\nGTF_to_BED successfully finished."
 
 
 
+STR__invalid_engine = """
+ERROR: Invalid engine specified:
+    {s}"""
+
+STR__invalid_grouping = """
+ERROR: Invalid grouping method specified:
+    {s}"""
+
+STR__invalid_level = """
+ERROR: Invalid feature level specified:
+    {s}"""
+
+STR__multi_hash = """
+ERROR: Additional outputs cannot be used with hash grouping."""
+
+STR__invalid_processes = """
+ERROR: Invalid number of processes specified:
+    {s}
+Please specify a positive integer."""
+
+STR__processes_incompatible = """
+ERROR: Multiple processes cannot be used with hash grouping or additional
+outputs."""
+
+STR__processes_engine = """
+ERROR: Multiple processes always use the Fast engine, and cannot be used with
+the Standard engine."""
+
+STR__invalid_format = """
+ERROR: Invalid output format specified:
+    {s}"""
+
+STR__format_incompatible = """
+ERROR: The BED12 format cannot be used with hash grouping or additional
+outputs."""
+
+
+
+STR__spill = "\tSpilling {N} IDs to disk..."
+
+STR__chunks = "\tSplit GTF file into {N} chunks..."
+
+
+
+STR__cache_begin = "\nWriting annotation cache..."
+
+STR__cache_complete = "\tAnnotation cache written. ({N} records)"
+
+
+
+STR__metrics_output = """
+Output: {P}
+    Field: {F}
+    Level: {L}"""
+
+
+
 # Lists ########################################################################
 
+LIST__standard = ["S", "s", "STANDARD", "Standard", "standard", "1"]
+LIST__fast = ["F", "f", "FAST", "Fast", "fast", "2"]
+
+LIST__consecutive = ["C", "c", "CONSECUTIVE", "Consecutive", "consecutive",
+        "1"]
+LIST__hash = ["H", "h", "HASH", "Hash", "hash", "2"]
+
+LIST__BED5 = ["BED5", "Bed5", "bed5", "5", "1"]
+LIST__BED12 = ["BED12", "Bed12", "bed12", "12", "2"]
+
+LIST__coding = ["C", "c", "CODING", "Coding", "coding", "1"]
+LIST__transcript = ["T", "t", "TRANSCRIPT", "Transcript", "transcript", "2"]
+LIST__exon = ["E", "e", "EXON", "Exon", "exon", "3"]
+
 
 
 # Dictionaries #################################################################
 
+DICT__level_features = {
+    LEVEL.CODING: {"start_codon": True, "stop_codon": True},
+    LEVEL.TRANSCRIPT: None, # All rows
+    LEVEL.EXON: {"exon": True}}
+
+DICT__level_str = {
+    LEVEL.CODING: "Coding",
+    LEVEL.TRANSCRIPT: "Transcript",
+    LEVEL.EXON: "Exon"}
+
 
 
 # Apply Globals ################################################################
@@ -214,7 +568,8 @@ PRINT.PRINT_METRICS = PRINT_METRICS
 # Functions ####################################################################
 
 def Convert_GTF_to_BED(path_in, field, path_out, header_in, header_out,
-            path_no_ID):
+            path_no_ID, engine=DEFAULT__engine, processes=DEFAULT__processes,
+            output_format=DEFAULT__format):
     """
     Convert a GTF file into a BED file, for GTF files which contain the
     coordinates of genetic elements like start codons, stop codons, and exons.
@@ -242,8 +597,95 @@ def Convert_GTF_to_BED(path_in, field, path_out, header_in, header_out,
     @path_out
             (str - filepath)
             The filepath of the output BED file.
+    @engine
+            (int) - Pseudo ENUM
+            The method used to read the GTF file:
+                1:  Standard - GTF_Reader
+                2:  Fast - GTF_Tag_Reader
+    @processes
+            (int)
+            The number of processes used. If more than one process is used, the
+            GTF file is split into chunks at group boundaries, which are parsed
+            in parallel using the Fast engine, and the results are combined in
+            their original order.
+    @output_format
+            (int) - Pseudo ENUM
+            The format of the output file:
+                1:  BED5
+                2:  BED12 - With blocks built from the exons, and the thick
+                    region spanning the start and stop codons.
+    
+    Convert_GTF_to_BED(str, str, bool, bool, int, int, int) -> int
+    """
+    # Setup the I/O
+    o = open(path_out, "w")
+    n = None
+    if path_no_ID: n = open(path_no_ID, "w")
+    
+    # Main loop
+    PRINT.printP(STR__convert_begin)
+    if processes > 1:
+        chunks = Get_GTF_Chunks(path_in, field,
+                processes*DEFAULT__chunks_per_process)
+        PRINT.printP(STR__chunks.format(N = len(chunks)))
+        jobs = [[path_in, field, start, end, output_format] for start, end in
+                chunks]
+        metrics = [0, 0, 0, 0, 0]
+        pool = multiprocessing.Pool(processes)
+        for bed, no_ID, chunk_metrics in pool.imap(Convert_GTF_Chunk, jobs):
+            o.write(bed)
+            if n: n.write(no_ID)
+            metrics = [a + b for a, b in zip(metrics, chunk_metrics)]
+        pool.close()
+        pool.join()
+    else:
+        if engine == ENGINE.FAST:
+            f = GTF_Tag_Reader()
+        else:
+            f = GTF_Reader()
+            f.Set_Grouping_Method("TAG")
+        f.Set_Tag(field)
+        f.Open(path_in)
+        metrics = Process_GTF_Groups(f, o, n, output_format)
+        f.Close()
+    PRINT.printP(STR__convert_complete)
+    
+    # Close up
+    if n: n.close()
+    o.close()
+    
+    # Reporting
+    Report_Metrics(metrics)
+
+    # Wrap up
+    return 0
+
+def Process_GTF_Groups(f, o, n, output_format=DEFAULT__format):
+    """
+    Read all the groups of an open GTF reader, write the coding coordinates of
+    each group to the output BED file, and write the rows of coding groups
+    without a valid ID to the no-ID file.
     
-    Convert_GTF_to_BED(str, str, bool, bool) -> int
+    Return the summary metrics, in the format used by Report_Metrics.
+    
+    @f
+            (GTF_Reader/GTF_Tag_Reader)
+            An open GTF reader, using TAG grouping.
+    @o
+            (file)
+            The output BED file.
+    @n
+            (file/None)
+            The output file for the entries which don't have a valid ID. None
+            indicates that these entries will be ignored.
+    @output_format
+            (int) - Pseudo ENUM
+            The format of the output file:
+                1:  BED5
+                2:  BED12
+    
+    Process_GTF_Groups(GTF_Reader, file, file, int) ->
+            [int, int, int, int, int]
     """
     # Setup reporting
     total_entries = 0
@@ -252,19 +694,7 @@ def Convert_GTF_to_BED(path_in, field, path_out, header_in, header_out,
     total_NC = 0
     total_no_ID = 0
     
-    # Setup the I/O
-    f = GTF_Reader()
-    f.Set_Grouping_Method("TAG")
-    f.Set_Tag(field)
-    f.Open(path_in)
-    
-    o = open(path_out, "w")
-
-    n = None
-    if path_no_ID: n = open(path_no_ID, "w")
-    
     # Main loop
-    PRINT.printP(STR__convert_begin)
     while not f.End():
         total_entries += 1
         # Read
@@ -291,23 +721,460 @@ def Convert_GTF_to_BED(path_in, field, path_out, header_in, header_out,
             total_coding += 1
             total_span += length
             # Write
-            sb = (chr_ + "\t" + start + "\t" + end + "\t" + gene + "\t" +
+            if output_format == FORMAT.BED12:
+                sb = Get_BED12_Row(gene, coords, f.Get())
+            else:
+                sb = (chr_ + "\t" + start + "\t" + end + "\t" + gene + "\t" +
                         strand + "\n")
             o.write(sb)
-    PRINT.printP(STR__convert_complete)
     
-    # Close up
-    if n: n.close()
-    o.close()
+    # Wrap up
+    return [total_entries, total_coding, total_span, total_NC, total_no_ID]
+
+def Get_BED12_Row(ID, coords, rows):
+    """
+    Return a row of a BED12 file for a coding group, with blocks built from its
+    exons, (or its CDS rows, if it has no exons) and with the thick region
+    spanning its start and stop codons.
+    
+    Overlapping blocks, such as the exons of different transcripts, are merged.
+    Coordinates are converted into 0-based, half-open coordinates, as required
+    by the BED12 format.
+    
+    @ID
+            (str)
+            The name/ID of the group.
+    @coords
+            (list)
+            The coding coordinates of the group, as returned by the GTF reader.
+    @rows
+            (list<list<str>>)
+            The rows of the group, split into columns.
+    
+    Get_BED12_Row(str, list, list<list<str>>) -> str
+    """
+    chr_, start, end, strand, length = coords
+    start -= 1
+    # Blocks
+    exons = []
+    CDS = []
+    for values in rows:
+        if values[2] == "exon": exons.append([int(values[3]) - 1,
+                int(values[4])])
+        elif values[2] == "CDS": CDS.append([int(values[3]) - 1,
+                int(values[4])])
+    blocks = exons or CDS or [[start, end]]
+    blocks.sort()
+    merged = [blocks[0]]
+    for block in blocks[1:]:
+        if block[0] <= merged[-1][1]:
+            if block[1] > merged[-1][1]: merged[-1][1] = block[1]
+        else: merged.append(block)
+    # Span
+    chr_start = merged[0][0]
+    chr_end = merged[-1][1]
+    thick_start = min(max(start, chr_start), chr_end)
+    thick_end = max(min(end, chr_end), thick_start)
+    sizes = [str(e - s) for s, e in merged]
+    starts = [str(s - chr_start) for s, e in merged]
+    # Row
+    values = [chr_, str(chr_start), str(chr_end), ID, "0", strand,
+            str(thick_start), str(thick_end), "0", str(len(merged)),
+            ",".join(sizes) + ",", ",".join(starts) + ","]
+    return "\t".join(values) + "\n"
+
+def Convert_GTF_Chunk(job):
+    """
+    Convert a chunk of a GTF file, for use by a process pool.
+    
+    Return the contents of the output BED file and the no-ID file for the
+    chunk, and the summary metrics of the chunk.
+    
+    @job
+            (list)
+            A list containing the filepath of the GTF file, the name of the
+            data field used as the name/ID, the byte range of the chunk, and
+            the format of the output file.
+    
+    Convert_GTF_Chunk([str, str, int, int, int]) -> [str, str, list<int>]
+    """
+    path_in, field, start, end, output_format = job
+    f = GTF_Tag_Reader()
+    f.Set_Tag(field)
+    f.Set_Range(start, end)
+    f.Open(path_in)
+    o = cStringIO.StringIO()
+    n = cStringIO.StringIO()
+    metrics = Process_GTF_Groups(f, o, n, output_format)
     f.Close()
+    return [o.getvalue(), n.getvalue(), metrics]
+
+def Get_GTF_Chunks(path_in, field, chunks):
+    """
+    Split a GTF file into roughly equal chunks, such that each chunk begins and
+    ends at a group boundary, (between two data rows with different values for
+    the specified field) and can be converted independently.
+    
+    Return a list of the byte ranges of the chunks, in order.
+    
+    @path_in
+            (str - filepath)
+            The filepath of the input GTF file.
+    @field
+            (str)
+            The name of the data field used to group the rows.
+    @chunks
+            (int)
+            The number of chunks to aim for. Fewer chunks may be returned if
+            the groups are large.
+    
+    Get_GTF_Chunks(str, str, int) -> list<[int, int]>
+    """
+    size = os.path.getsize(path_in)
+    boundaries = [0]
+    f = open(path_in, "rb")
+    for i in range(1, chunks):
+        target = (size*i)/chunks
+        if target <= boundaries[-1]: continue
+        f.seek(target)
+        f.readline() # Align to the start of a row
+        boundary = size
+        previous = None
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if not line: break
+            if line[0] == "#" or not line.strip(): continue
+            ID = Get_Tag_Value(line, field)
+            if previous != None and ID != previous:
+                boundary = position
+                break
+            previous = ID
+        if boundary == size: break
+        boundaries.append(boundary)
+    f.close()
+    boundaries.append(size)
+    return [[boundaries[i], boundaries[i+1]] for i in range(len(boundaries)-1)]
+
+def Convert_GTF_to_BED__HASH(path_in, field, path_out, path_no_ID):
+    """
+    Convert a GTF file into a BED file, for GTF files which contain the
+    coordinates of genetic elements like start codons, stop codons, and exons.
+    
+    Unlike Convert_GTF_to_BED, the rows for each ID do not need to be next to
+    each other. The coding coordinates of every ID are accumulated in a hash
+    table, which is spilled to disk whenever it holds more IDs than the spill
+    threshold. The output BED file is written in sorted genomic order.
+    
+    Rows without a valid ID are all written to the no-ID file, if one is
+    specified, and are counted as a single element.
+    
+    @path_in
+            (str - filepath)
+            The filepath of the input GTF file.
+    @field
+            (str)
+            The name of the data field used as the name/ID of the resulting
+            sequences.
+    @path_out
+            (str - filepath)
+            The filepath of the output BED file.
+    @path_no_ID
+            (str - filepath)
+            The filepath of the output file for the rows without a valid ID.
+            An empty string indicates that these rows will be ignored.
+    
+    Convert_GTF_to_BED__HASH(str, str, str, str) -> int
+    """
+    coding_features = GTF_Tag_Reader._CONFIG__coding_features
+    folder = os.path.dirname(os.path.abspath(path_out))
+    
+    # Setup reporting
+    total_entries = 0
+    total_coding = 0
+    total_span = 0
+    total_NC = 0
+    total_no_ID = 0
+    
+    # Setup the I/O
+    f = open(path_in, "U")
+    n = None
+    if path_no_ID: n = open(path_no_ID, "w")
+    
+    # Accumulate coordinates
+    PRINT.printP(STR__convert_begin)
+    table = {} # {ID: [chr, start, end, strand]}, or {ID: []} if non-coding
+    spills = []
+    sorted_spills = []
+    try:
+        for line in f:
+            if line[0] == "#" or not line.strip(): continue
+            ID = Get_Tag_Value(line, field)
+            if not ID and n:
+                values = line.rstrip("\r\n").split("\t")
+                n.write("\t".join(values[:9]) + "\n")
+            # Feature type (3rd column)
+            index_1 = line.find("\t")
+            index_2 = line.find("\t", index_1 + 1)
+            index_3 = line.find("\t", index_2 + 1)
+            if line[index_2+1:index_3] in coding_features:
+                values = line.split("\t", 8)
+                s = int(values[3])
+                e = int(values[4])
+                coords = table.get(ID, None)
+                if coords:
+                    if s < coords[1]: coords[1] = s
+                    if e > coords[2]: coords[2] = e
+                else:
+                    table[ID] = [values[0], s, e, values[6]]
+            elif ID not in table:
+                table[ID] = []
+            # Spill
+            if len(table) >= DEFAULT__spill_threshold:
+                PRINT.printP(STR__spill.format(N = len(table)))
+                records = [[ID] + table[ID] for ID in table]
+                spills.append(Write_Spill(records, folder))
+                table = {}
+        f.close()
+        if n: n.close()
+        
+        # Combine spills (records sorted by ID)
+        if spills:
+            records = [[ID] + table[ID] for ID in table]
+            spills.append(Write_Spill(records, folder))
+            table = {}
+            records = Merge_Spills(spills)
+        else:
+            records = ([ID] + table[ID] for ID in table)
+        
+        # Sort coding sequences by genomic coordinates
+        coding = []
+        for record in records:
+            total_entries += 1
+            if len(record) == 1: # Non-coding
+                total_NC += 1
+                continue
+            ID, chr_, start, end, strand = record
+            if not ID: # No ID
+                total_no_ID += 1
+                continue
+            total_coding += 1
+            total_span += end - start + 1
+            coding.append([chr_, start, end, ID, strand])
+            if len(coding) >= DEFAULT__spill_threshold:
+                PRINT.printP(STR__spill.format(N = len(coding)))
+                sorted_spills.append(Write_Spill(coding, folder))
+                coding = []
+        for path in spills: os.remove(path)
+        if sorted_spills:
+            sorted_spills.append(Write_Spill(coding, folder))
+            coding = heapq.merge(*[Read_Spill(path) for path in sorted_spills])
+        else:
+            coding.sort()
+        
+        # Write
+        o = open(path_out, "w")
+        for chr_, start, end, ID, strand in coding:
+            sb = (chr_ + "\t" + str(start) + "\t" + str(end) + "\t" + ID +
+                    "\t" + strand + "\n")
+            o.write(sb)
+        o.close()
+    finally:
+        # Spill files are always removed, even if conversion failed
+        for path in spills + sorted_spills:
+            if os.path.exists(path): os.remove(path)
+    
+    PRINT.printP(STR__convert_complete)
     
     # Reporting
     Report_Metrics([total_entries, total_coding, total_span, total_NC,
             total_no_ID])
+    
+    # Wrap up
+    return 0
 
+def Convert_GTF_to_BED__MULTI(path_in, outputs, path_no_ID):
+    """
+    Convert a GTF file into several BED files in a single pass, for GTF files
+    which contain the coordinates of genetic elements like start codons, stop
+    codons, and exons.
+    
+    Each output uses its own field as the name/ID, groups consecutive rows which
+    share the same ID, and reports one of the following for each group:
+        1:  Coding - The span of the start and stop codons.
+        2:  Transcript - The span of all the rows in the group.
+        3:  Exon - Every exon, as a separate BED row.
+    
+    All output BED files are 5-column TSVs, in the same format as those of
+    Convert_GTF_to_BED.
+    
+    @path_in
+            (str - filepath)
+            The filepath of the input GTF file.
+    @outputs
+            (list<[str, int, str]>)
+            A list of the outputs. Each output is a list containing the name of
+            the data field used as the name/ID, the feature level (Pseudo ENUM,
+            as above), and the filepath of the output BED file.
+    @path_no_ID
+            (str - filepath)
+            The filepath of the output file for the entries which don't have a
+            valid ID, for the first output. An empty string indicates that
+            these entries will be ignored.
+    
+    Convert_GTF_to_BED__MULTI(str, list<[str, int, str]>, str) -> int
+    """
+    # Setup the I/O
+    f = open(path_in, "U")
+    bed_outputs = []
+    for field, level, path_out in outputs:
+        bed_outputs.append(BED_Output(field, level, path_out, path_no_ID))
+        path_no_ID = "" # First output only
+    
+    # Feature types which need to be split into columns
+    split_all = False
+    features = {}
+    for output in bed_outputs:
+        if output.features: features.update(output.features)
+        else: split_all = True
+    
+    # Main loop
+    PRINT.printP(STR__convert_begin)
+    for line in f:
+        if line[0] == "#" or not line.strip(): continue
+        # Feature type (3rd column)
+        index_1 = line.find("\t")
+        index_2 = line.find("\t", index_1 + 1)
+        index_3 = line.find("\t", index_2 + 1)
+        feature = line[index_2+1:index_3]
+        values = None
+        if split_all or feature in features: values = line.split("\t", 8)
+        # Outputs
+        for output in bed_outputs: output.Add(line, feature, values)
+    PRINT.printP(STR__convert_complete)
+    
+    # Close up
+    f.close()
+    for output in bed_outputs: output.Close()
+    
+    # Reporting
+    for output in bed_outputs:
+        PRINT.printM(STR__metrics_output.format(P = output.path_out,
+                F = output.field, L = DICT__level_str[output.level]))
+        Report_Metrics(output.Get_Metrics())
+    
     # Wrap up
     return 0
 
+def Write_Cache_From_BED(path_bed, path_cache):
+    """
+    Write an annotation cache, (See: Annotation_Cache_File_Reader.py) which
+    can be memory-mapped and queried by name or by coordinates, containing the
+    records of a BED file produced by this program.
+    
+    The cache uses the same 1-based inclusive coordinates as the BED5 output.
+    The 0-based starts of BED12 records are converted accordingly.
+    
+    @path_bed
+            (str - filepath)
+            The filepath of the BED file produced by this program.
+    @path_cache
+            (str - filepath)
+            The filepath of the annotation cache to be written.
+    
+    Write_Cache_From_BED(str, str) -> int
+    """
+    PRINT.printP(STR__cache_begin)
+    records = []
+    f = open(path_bed, "U")
+    for line in f:
+        values = line.rstrip("\n").split("\t")
+        if len(values) < 5: continue
+        start = int(values[1])
+        if len(values) < 12: strand = values[4]
+        else: # BED12 - 0-based, half-open
+            strand = values[5]
+            start += 1
+        records.append([values[0], start, int(values[2]), values[3], strand])
+    f.close()
+    Write_Annotation_Cache(path_cache, records)
+    PRINT.printP(STR__cache_complete.format(N = len(records)))
+    return 0
+
+def Write_Spill(records, folder):
+    """
+    Sort a list of records and write them to a temporary spill file in the
+    specified folder. Return the filepath of the spill file. The spill file is
+    removed if it cannot be written in full.
+    
+    @records
+            (list<list>)
+            The records to be spilled. Each record is a list of strings and
+            integers.
+    @folder
+            (str - dirpath)
+            The folder in which to create the spill file.
+    
+    Write_Spill(list<list>, str) -> str
+    """
+    records.sort()
+    handle, path = tempfile.mkstemp(FILEMOD__SPILL, "", folder)
+    o = os.fdopen(handle, "wb")
+    try:
+        for record in records: marshal.dump(record, o)
+        o.close()
+    except:
+        o.close()
+        os.remove(path)
+        raise
+    return path
+
+def Read_Spill(path):
+    """
+    Yield the records in a spill file, in the order they were written.
+    
+    @path
+            (str - filepath)
+            The filepath of the spill file.
+    
+    Read_Spill(str) -> generator<list>
+    """
+    f = open(path, "rb")
+    try:
+        while True: yield marshal.load(f)
+    except EOFError:
+        pass
+    f.close()
+
+def Merge_Spills(paths):
+    """
+    Merge the ID records of several spill files, combining the coordinates of
+    records which share the same ID. Yield the combined records in order of
+    their IDs.
+    
+    Each record is a list containing the ID, followed by the chromosome, the
+    lowest coordinate, the highest coordinate, and the strand for IDs with
+    coding coordinates.
+    
+    @paths
+            (list<str - filepath>)
+            The filepaths of the spill files.
+    
+    Merge_Spills(list<str>) -> generator<list>
+    """
+    current = None
+    for record in heapq.merge(*[Read_Spill(path) for path in paths]):
+        if current and record[0] == current[0]:
+            if len(record) == 1: continue
+            if len(current) == 1: current = record
+            else:
+                if record[2] < current[2]: current[2] = record[2]
+                if record[3] > current[3]: current[3] = record[3]
+            continue
+        if current: yield current
+        current = record
+    if current: yield current
+
 def Report_Metrics(summary_metrics):
     """
     Print a report into the command line interface of the metrics of the
@@ -328,10 +1195,16 @@ def Report_Metrics(summary_metrics):
     # Unpacking
     total, coding, span, NC, no_ID = summary_metrics
     # Calculations
-    percentage_coding = (coding*100.0)/total
-    percentage_NC = (NC*100.0)/total
-    percentage_no_ID = (no_ID*100.0)/total
-    avg_span = (float(span))/coding
+    if total:
+        percentage_coding = (coding*100.0)/total
+        percentage_NC = (NC*100.0)/total
+        percentage_no_ID = (no_ID*100.0)/total
+    else:
+        percentage_coding = 0.0
+        percentage_NC = 0.0
+        percentage_no_ID = 0.0
+    if coding: avg_span = (float(span))/coding
+    else: avg_span = 0.0
     # Strings
     total = str(total)
     coding = str(coding)
@@ -408,16 +1281,27 @@ def Parse_Command_Line_Input__GTF_to_BED(raw_command_line_input):
     header_in = DEFAULT__headers_in
     header_out = DEFAULT__headers_out
     path_no_ID = ""
+    engine = DEFAULT__engine
+    engine_specified = False
+    grouping = DEFAULT__grouping
+    outputs = []
+    processes = DEFAULT__processes
+    path_cache = ""
+    output_format = DEFAULT__format
     
     # Validate optional inputs (except output path)
     while inputs:
         arg = inputs.pop(0)
         try: # Following arguments
-            if arg in ["-o", "-n"]:
+            if arg in ["-o", "-n", "-e", "-g", "-p", "-c", "-f"]:
                 arg2 = inputs.pop(0)
             elif arg in ["-h"]:
                 arg2 = inputs.pop(0)
                 arg3 = inputs.pop(0)
+            elif arg in ["-x"]:
+                arg2 = inputs.pop(0)
+                arg3 = inputs.pop(0)
+                arg4 = inputs.pop(0)
             else: # Invalid
                 arg = Strip_X(arg)
                 PRINT.printE(STR__invalid_argument.format(s = arg))
@@ -432,6 +1316,45 @@ def Parse_Command_Line_Input__GTF_to_BED(raw_command_line_input):
             path_out = arg2
         elif arg == "-n":
             path_no_ID = arg2
+        elif arg == "-c":
+            path_cache = arg2
+        elif arg == "-f":
+            if arg2 in LIST__BED5: output_format = FORMAT.BED5
+            elif arg2 in LIST__BED12: output_format = FORMAT.BED12
+            else:
+                PRINT.printE(STR__invalid_format.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-e":
+            engine_specified = True
+            if arg2 in LIST__standard: engine = ENGINE.STANDARD
+            elif arg2 in LIST__fast: engine = ENGINE.FAST
+            else:
+                PRINT.printE(STR__invalid_engine.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-g":
+            if arg2 in LIST__consecutive: grouping = GROUPING.CONSECUTIVE
+            elif arg2 in LIST__hash: grouping = GROUPING.HASH
+            else:
+                PRINT.printE(STR__invalid_grouping.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
+        elif arg == "-x":
+            if arg3 in LIST__coding: level = LEVEL.CODING
+            elif arg3 in LIST__transcript: level = LEVEL.TRANSCRIPT
+            elif arg3 in LIST__exon: level = LEVEL.EXON
+            else:
+                PRINT.printE(STR__invalid_level.format(s = arg3))
+                PRINT.printE(STR__use_help)
+                return 1
+            outputs.append([arg2, level, arg4])
+        elif arg == "-p":
+            processes = Validate_Int_NonNeg(arg2)
+            if processes < 1:
+                PRINT.printE(STR__invalid_processes.format(s = arg2))
+                PRINT.printE(STR__use_help)
+                return 1
         else: # arg == "-h"
             header_in = Validate_Bool(arg2)
             if header_in == None:
@@ -442,6 +1365,26 @@ def Parse_Command_Line_Input__GTF_to_BED(raw_command_line_input):
                 printE(STR__invalid_bool.format(s = arg3))
                 return 1
     
+    # Check for incompatible options
+    if outputs and grouping == GROUPING.HASH:
+        PRINT.printE(STR__multi_hash)
+        PRINT.printE(STR__use_help)
+        return 1
+    if processes > 1 and (outputs or grouping == GROUPING.HASH):
+        PRINT.printE(STR__processes_incompatible)
+        PRINT.printE(STR__use_help)
+        return 1
+    if processes > 1 and engine_specified and engine == ENGINE.STANDARD:
+        PRINT.printE(STR__processes_engine)
+        PRINT.printE(STR__use_help)
+        return 1
+    if processes > 1: engine = ENGINE.FAST
+    if output_format == FORMAT.BED12 and (outputs or
+            grouping == GROUPING.HASH):
+        PRINT.printE(STR__format_incompatible)
+        PRINT.printE(STR__use_help)
+        return 1
+    
     # Automated output path generation
     if not path_out: Generate_Default_Output_File_Path_From_File(path_in,
             FILEMOD, False)
@@ -464,10 +1407,37 @@ def Parse_Command_Line_Input__GTF_to_BED(raw_command_line_input):
         if valid_out == 4:
             PRINT.printE(STR__IO_error_write_unable)
             return 1
+    if path_cache:
+        valid_out = Validate_Write_Path__FILE(path_cache)
+        if valid_out == 2: return 0
+        if valid_out == 3:
+            PRINT.printE(STR__IO_error_write_forbid)
+            return 1
+        if valid_out == 4:
+            PRINT.printE(STR__IO_error_write_unable)
+            return 1
+    for output in outputs:
+        valid_out = Validate_Write_Path__FILE(output[2])
+        if valid_out == 2: return 0
+        if valid_out == 3:
+            PRINT.printE(STR__IO_error_write_forbid)
+            return 1
+        if valid_out == 4:
+            PRINT.printE(STR__IO_error_write_unable)
+            return 1
     
     # Run program
-    exit_state = Convert_GTF_to_BED(path_in, field, path_out, header_in,
-            header_out, path_no_ID)
+    if outputs:
+        outputs = [[field, LEVEL.CODING, path_out]] + outputs
+        exit_state = Convert_GTF_to_BED__MULTI(path_in, outputs, path_no_ID)
+    elif grouping == GROUPING.HASH:
+        exit_state = Convert_GTF_to_BED__HASH(path_in, field, path_out,
+                path_no_ID)
+    else:
+        exit_state = Convert_GTF_to_BED(path_in, field, path_out, header_in,
+                header_out, path_no_ID, engine, processes, output_format)
+    if exit_state == 0 and path_cache:
+        exit_state = Write_Cache_From_BED(path_out, path_cache)
     
     # Exit
     if exit_state == 0: return 0
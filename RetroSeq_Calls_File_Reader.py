@@ -4,6 +4,7 @@ RETROSEQ CALLS FILE READER
 by Angelo Chan
 
 This module contains a Class capable of reading and interpretting a RetroSeq
+Calls VCF file, and a Class capable of querying an in-memory index of a RetroSeq
 Calls VCF file.
 """
 
@@ -12,6 +13,14 @@ Calls VCF file.
 from File_Reader import *
 from Table_File_Reader import *
 
+import os
+import sys
+import array
+import bisect
+import collections
+import mmap
+import struct
+
 
 
 # Lists ########################################################################
@@ -35,6 +44,12 @@ class RetroSeq_Calls_Reader(Table_Reader):
     Aside from reading and parsing the data, row by row, the RetroSeq Calls
     reader was specifically made to look at data across multiple rows which
     fall within the same "region" and pick the best "call".
+    
+    The buffered rows are held in a deque, alongside a second deque of the
+    buffered rows which are not outsupported by any later row, in descending
+    order of read count. Rows leave the buffer in the order they entered it, so
+    the best calls are always at the front of the second deque, and neither
+    clearing the buffer nor finding the best calls requires a full scan.
 
     Designed for the following use:
     
@@ -89,7 +104,7 @@ class RetroSeq_Calls_Reader(Table_Reader):
         Table_Reader.__init__(self, file_path, False, "\t", [], [], True)
         self.current_raw = self.next_raw = ""
         self.header_text = ""
-        self.buffer = []
+        self._reset_buffer()
         self.Create_Chr_Order(chr_order)
     
     def Create_Chr_Order(self, chr_order):
@@ -159,7 +174,7 @@ class RetroSeq_Calls_Reader(Table_Reader):
         while self._within_range(coords) and not self.EOF:
             self.Read(1)
             current = self.Get_Current()
-            self.buffer.append(current)
+            self._add_to_buffer(current)
     
     def Get_Best(self):
         """
@@ -171,26 +186,47 @@ class RetroSeq_Calls_Reader(Table_Reader):
         
         If the buffer is empty, return an empty list.
         """
-        if not self.buffer: return [] # Empty buffer
-        best = [self.buffer[0]] # First element in buffer
-        for entry in self.buffer[1:]: # Look at the rest
-            if entry[2] > best[0][2]: # New winner
-                best = [entry]
-            elif entry[2] == best[0][2]: # Tied
-                best.append(entry)
+        best = []
+        maxima = self.maxima
+        if not maxima: return best # Empty buffer
+        count = maxima[0][2]
+        for entry in maxima: # Tied entries are all at the front
+            if entry[2] != count: break
+            best.append(entry)
         return best
     
+    def _reset_buffer(self):
+        """
+        Empty the buffer.
+        """
+        self.buffer = collections.deque()
+        self.maxima = collections.deque() # Read counts in descending order
+    
+    def _add_to_buffer(self, entry):
+        """
+        Add an entry to the end of the buffer. Entries in [maxima] with a lower
+        read count can never be the best calls again, and are discarded.
+        """
+        self.buffer.append(entry)
+        maxima = self.maxima
+        count = entry[2]
+        while maxima and maxima[-1][2] < count: maxima.pop()
+        maxima.append(entry)
+    
     def _clear_buffer(self, coords):
         """
         Removes all data in the buffer which does not fall within the given
         coordinates.
         """
-        flag = True
-        while flag and self.buffer:
-            if coords[0] != self.buffer[0][0] or coords[1] > self.buffer[0][1]:
-                self.buffer.pop(0)
+        buffer_ = self.buffer
+        maxima = self.maxima
+        while buffer_:
+            first = buffer_[0]
+            if coords[0] != first[0] or coords[1] > first[1]:
+                buffer_.popleft()
+                if maxima and maxima[0] is first: maxima.popleft()
             else:
-                flag = False
+                break
     
     def _behind_range(self, coords):
         """
@@ -233,12 +269,13 @@ class RetroSeq_Calls_Reader(Table_Reader):
     
     def _get_next_element(self):
         """
-        Read in the next row and process it.
+        Read in the next row and process it. Header lines are skipped.
         
         Return an empty list if the end of the file has been reached.
         """
         if self.EOF: return []
         raw = self.file.readline()
+        while raw[:1] == "#": raw = self.file.readline()
         data = self._process_line(raw)
         return data
     
@@ -246,24 +283,302 @@ class RetroSeq_Calls_Reader(Table_Reader):
         """
         Process a line of data.
         
+        Only the first 9 columns are split off, so any sample columns after the
+        first are never split. Files with more than one sample column are
+        therefore accepted. The called TE is taken directly from the first
+        entry of the INFO column, without splitting the rest of the column.
+        
         Returns a list containing the chromsome name, a basepair coordinate,
         the number of reads which support the called TE, and the called TE.
         
         _proces_line(str) -> [str, int, int, str]
         """
         if not line: return []
-        values = line.split(self.delimiter)
-        if not values: return []
+        values = line.split(self.delimiter, 9)
         if len(values) != 10:
             self.printE(self._MSG__faulty_line.format(S = str([line])[1:-1]))
             return []
-        chromosome = values[0]
-        coord = int(values[1])
-        count = int(values[5])
         string = values[7]
-        substrings = string.split(",")
-        subsubstrings = substrings[0].split("=")
-        called = subsubstrings[1]
-        return [chromosome, coord, count, called]
+        start = string.find("=") + 1
+        end = string.find(",")
+        if end == -1: end = len(string)
+        if not start or start > end:
+            self.printE(self._MSG__faulty_line.format(S = str([line])[1:-1]))
+            return []
+        return [values[0], int(values[1]), int(values[5]), string[start:end]]
 
 
+
+class RetroSeq_Calls_Index(RetroSeq_Calls_Reader):
+    """
+    The RetroSeq Calls Index has the same interface as the RetroSeq Calls
+    Reader, but loads the entire RetroSeq Calls file into memory when opened,
+    as sorted arrays of coordinates, read counts and called TEs for each
+    chromosome. The called TEs are stored as indexes into a list of the
+    distinct called TEs.
+    
+    Each call to Read_Until is then a binary search over the calls on the
+    chromosome of the specified coordinates. Neither the RetroSeq Calls file nor
+    the coordinates queried need to be in any particular order, and no
+    chromosome order needs to be specified.
+    
+    If caching is enabled, the arrays are also written to a binary cache file,
+    alongside the RetroSeq Calls file. The next time the same file is opened,
+    the cache is memory-mapped and the arrays are copied directly out of it,
+    without the RetroSeq Calls file being parsed again. The cache is only used
+    if the filepath, modification time and size of the RetroSeq Calls file all
+    match those recorded in the cache. Otherwise, it is rebuilt.
+    
+    The cache file consists of the following, in order. All integers are
+    unsigned 32-bit little-endian integers, apart from the modification time
+    (a 64-bit float) and the file size (a 64-bit integer):
+    
+        Header
+        Filepath            - The absolute filepath of the RetroSeq Calls file.
+        Chromosome table    - Name offset, name length, index of the first
+                              record, and number of records, for each
+                              chromosome.
+        Name table          - Offset and length of each distinct called TE.
+        Coordinates         - One for each record, sorted by chromosome and
+                              coordinate.
+        Read counts         - One for each record.
+        Called TEs          - One index into the name table for each record.
+        String table        - The chromosome names and called TEs.
+    
+    Designed for the following use:
+    
+    f = RetroSeq_Calls_Index()
+    f.Set_New_Path("F:/Filepath.vcf")
+    f.Set_Cache(True)
+    f.Open()
+    
+    for coordinates in list_of_coordinates:
+        f.Read_Until(coordinates)
+        best = f.Get_Best()
+        # Your code - You may access buffered elements in best
+    
+    f.Close()
+    """
+    
+    # Minor Configurations #####################################################
+    
+    _CONFIG__cache_extension = ".rscache"
+    _CONFIG__cache_magic = "RSCC"
+    _CONFIG__cache_version = 1
+    
+    
+    
+    # Structs ##################################################################
+    
+    _STRUCT__header = struct.Struct("<4sIdQIIIII")
+    # Magic, version, modification time, file size, filepath length,
+    # chromosomes, records, names, and the total size of the cache
+    
+    _STRUCT__chr = struct.Struct("<IIII")
+    # Name offset, name length, first record, number of records
+    
+    _STRUCT__name = struct.Struct("<II")
+    # Name offset, name length
+    
+    
+    
+    # Constructor & Destructor #################################################
+    
+    def __init__(self, file_path="", chr_order=[]):
+        """
+        Creates a RetroSeq Calls Index object. The chromosome order is
+        accepted for compatibility with the RetroSeq Calls Reader, but is not
+        required.
+        """
+        RetroSeq_Calls_Reader.__init__(self, file_path, chr_order)
+        self.index = {} # {chr: [array<int>, array<int>, array<int>]}
+        self.names = []
+        self.cache = False
+    
+    
+    
+    # Property Methods #########################################################
+    
+    def Set_Cache(self, cache):
+        """
+        Specify whether or not the index should be loaded from, and saved to, a
+        binary cache file alongside the RetroSeq Calls file.
+        """
+        self.cache = cache
+    
+    
+    
+    # File I/O Methods #########################################################
+    
+    def Open(self, new_path=""):
+        """
+        Load the file into memory. If a file path is not specified, the stored
+        file path will be used instead.
+        
+        Comment lines and blank lines are ignored.
+        """
+        if new_path: self.file_path = new_path
+        self._reset_buffer()
+        if self.cache and self._read_cache(): return
+        calls = {}
+        f = open(self.file_path, "U")
+        for line in f:
+            if line[:1] == "#" or not line.strip(): continue
+            data = self._process_line(line)
+            if data: calls.setdefault(data[0], []).append(data)
+        f.close()
+        self.index = {}
+        self.names = []
+        name_indexes = {}
+        for chr_ in calls:
+            entries = calls[chr_]
+            entries.sort(key = lambda entry: entry[1]) # Stable
+            indexes = array.array("I")
+            for entry in entries:
+                index = name_indexes.get(entry[3], None)
+                if index == None:
+                    index = len(self.names)
+                    name_indexes[entry[3]] = index
+                    self.names.append(entry[3])
+                indexes.append(index)
+            self.index[chr_] = [array.array("I", [entry[1] for entry in
+                    entries]), array.array("I", [entry[2] for entry in
+                    entries]), indexes]
+        if self.cache: self._write_cache()
+    
+    def Close(self):
+        """
+        Release the index.
+        """
+        self.index = {}
+        self.names = []
+        self._reset_buffer()
+    
+    def _read_cache(self):
+        """
+        Load the index from the cache file, if it exists and is up to date.
+        
+        Return True if the index was loaded.
+        Return False otherwise.
+        """
+        path_cache = self.file_path + self._CONFIG__cache_extension
+        try:
+            stats = os.stat(self.file_path)
+            f = open(path_cache, "rb")
+        except EnvironmentError:
+            return False
+        try:
+            map_ = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError): # Empty file
+            f.close()
+            return False
+        header = self._STRUCT__header
+        valid = False
+        if len(map_) >= header.size:
+            (magic, version, mtime, size, path_length, chromosomes, records,
+                    names, total) = header.unpack_from(map_, 0)
+            path = map_[header.size:header.size+path_length]
+            valid = (magic == self._CONFIG__cache_magic and
+                    version == self._CONFIG__cache_version and
+                    total == len(map_) and mtime == stats.st_mtime and
+                    size == stats.st_size and
+                    path == os.path.abspath(self.file_path))
+        if valid:
+            offset = header.size + path_length
+            chr_table = []
+            for i in range(chromosomes):
+                chr_table.append(self._STRUCT__chr.unpack_from(map_, offset))
+                offset += self._STRUCT__chr.size
+            name_table = []
+            for i in range(names):
+                name_table.append(self._STRUCT__name.unpack_from(map_, offset))
+                offset += self._STRUCT__name.size
+            columns = []
+            for i in range(3):
+                column = array.array("I")
+                column.fromstring(map_[offset:offset+records*column.itemsize])
+                if sys.byteorder == "big": column.byteswap()
+                columns.append(column)
+                offset += records*column.itemsize
+            positions, counts, indexes = columns
+            self.names = [map_[offset+o:offset+o+l] for o, l in name_table]
+            self.index = {}
+            for name_offset, name_length, first, count in chr_table:
+                chr_ = map_[offset+name_offset:offset+name_offset+name_length]
+                last = first + count
+                self.index[chr_] = [positions[first:last], counts[first:last],
+                        indexes[first:last]]
+        map_.close()
+        f.close()
+        return valid
+    
+    def _write_cache(self):
+        """
+        Write the index to the cache file. Failure to write the cache file is
+        not an error, as the cache is only an optimization.
+        """
+        path_cache = self.file_path + self._CONFIG__cache_extension
+        stats = os.stat(self.file_path)
+        path = os.path.abspath(self.file_path)
+        strings = []
+        string_offset = 0
+        # Chromosome table
+        chr_table = []
+        columns = [array.array("I"), array.array("I"), array.array("I")]
+        for chr_ in sorted(self.index):
+            chr_table.append(self._STRUCT__chr.pack(string_offset, len(chr_),
+                    len(columns[0]), len(self.index[chr_][0])))
+            strings.append(chr_)
+            string_offset += len(chr_)
+            for i in range(3): columns[i].extend(self.index[chr_][i])
+        # Name table
+        name_table = []
+        for name in self.names:
+            name_table.append(self._STRUCT__name.pack(string_offset,
+                    len(name)))
+            strings.append(name)
+            string_offset += len(name)
+        # Body
+        if sys.byteorder == "big":
+            for column in columns: column.byteswap()
+        body = path + "".join(chr_table) + "".join(name_table) + "".join([
+                column.tostring() for column in columns]) + "".join(strings)
+        header = self._STRUCT__header.pack(self._CONFIG__cache_magic,
+                self._CONFIG__cache_version, stats.st_mtime, stats.st_size,
+                len(path), len(chr_table), len(columns[0]), len(name_table),
+                self._STRUCT__header.size + len(body))
+        # Write
+        try:
+            o = open(path_cache, "wb")
+            o.write(header)
+            o.write(body)
+            o.close()
+        except EnvironmentError:
+            pass
+    
+    
+    
+    # File Reading Methods #####################################################
+    
+    def Read_Until(self, coords):
+        """
+        Fill the buffer with all the entries within the specified range,
+        replacing its previous contents.
+        
+        @coords
+                ([str, int, int])
+                The coordinates of the region of interest. The values are,
+                respectively, the chromosome name, the start of the region of
+                interest (bp) and the end of the region of interest (bp).
+        """
+        self._reset_buffer()
+        chr_ = coords[0]
+        entry = self.index.get(chr_, None)
+        if not entry: return
+        positions, counts, indexes = entry
+        names = self.names
+        start = bisect.bisect_left(positions, coords[1])
+        end = bisect.bisect_right(positions, coords[2])
+        for i in range(start, end):
+            self._add_to_buffer([chr_, positions[i], counts[i],
+                    names[indexes[i]]])